@@ -0,0 +1,155 @@
+"""
+Offline benchmark harness: serves recorded EDGAR fixtures in place of sec.gov and
+stubs the Gemini client, so every stage of the pipeline can be timed without network access.
+"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types as pytypes
+
+import pytest
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# buffett_app reads its configuration at import time
+_bench_cache_root = tempfile.mkdtemp(prefix="buffett-bench-")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-placeholder-key")
+os.environ["TICKER_INDEX_REFRESH_SECONDS"] = "0"
+os.environ["SEC_MAX_REQUESTS_PER_SECOND"] = "0"
+os.environ["CACHE_DB_PATH"] = os.path.join(_bench_cache_root, "buffett.sqlite3")
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import buffett_app  # noqa: E402
+
+def _load_manifest():
+    with open(os.path.join(FIXTURES_DIR, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)["filings"]
+
+def _filing_url(filing):
+    accession = filing["accession"].replace("-", "")
+    return f"https://www.sec.gov/Archives/edgar/data/{int(filing['cik'])}/{accession}/{filing['primary_document']}"
+
+class RecordedEdgar:
+    """Stand-in for sec_session.get that answers from benchmarks/fixtures."""
+
+    def __init__(self, pad_tickers=10000):
+        self.filings = []
+        self.responses = {}
+        self.requests = 0
+        self.bytes_served = 0
+
+        with open(os.path.join(FIXTURES_DIR, "company_tickers.json"), encoding="utf-8") as f:
+            tickers = json.load(f)
+        # Pad to the size of the real file so index build times are representative
+        for i in range(len(tickers), pad_tickers):
+            tickers[str(i)] = {"cik_str": 8000000 + i, "ticker": f"ZZ{i:05d}", "title": f"Padding Company {i}"}
+        self.responses[buffett_app.TICKER_INDEX_URL] = ("application/json", json.dumps(tickers).encode("utf-8"))
+
+        for filing in _load_manifest():
+            with gzip.open(os.path.join(FIXTURES_DIR, filing["file"]), "rb") as f:
+                content = f.read()
+            url = _filing_url(filing)
+            self.responses[url] = ("text/html", content)
+            with open(os.path.join(FIXTURES_DIR, "submissions", f"CIK{filing['cik']}.json"), "rb") as f:
+                submissions = f.read()
+            self.responses[f"https://data.sec.gov/submissions/CIK{filing['cik']}.json"] = ("application/json", submissions)
+            self.filings.append(dict(filing, url=url, html=content))
+
+    def get(self, url, headers=None, timeout=None, stream=False, **kwargs):
+        self.requests += 1
+        response = requests.models.Response()
+        response.url = url
+        if url not in self.responses:
+            response.status_code = 404
+            response._content = b""
+        else:
+            content_type, content = self.responses[url]
+            response.status_code = 200
+            response.headers["Content-Type"] = content_type
+            response._content = content
+            self.bytes_served += len(content)
+        response._content_consumed = True
+        return response
+
+class FakeGeminiModels:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _response(self, text):
+        return pytypes.SimpleNamespace(
+            text=text,
+            usage_metadata=pytypes.SimpleNamespace(prompt_token_count=0, candidates_token_count=0),
+            candidates=[pytypes.SimpleNamespace(content=pytypes.SimpleNamespace(
+                parts=[pytypes.SimpleNamespace(inline_data=pytypes.SimpleNamespace(data=b"\0\0" * 2400))]))],
+        )
+
+    def generate_content(self, model=None, contents=None, config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(f"Stub summary of {len(str(contents))} characters from {model}.")
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        for word in f"Stub summary of {len(str(contents))} characters from {model}.".split(" "):
+            yield self._response(word + " ")
+
+class FakeGeminiCaches:
+    def __init__(self):
+        self.created = []
+
+    def create(self, model=None, config=None):
+        name = f"cachedContents/stub-{len(self.created)}"
+        self.created.append(name)
+        return pytypes.SimpleNamespace(name=name, model=model)
+
+class FakeGeminiClient:
+    def __init__(self, latency=0.0):
+        self.models = FakeGeminiModels(latency)
+        self.caches = FakeGeminiCaches()
+
+@pytest.fixture(scope="session")
+def recorded_edgar():
+    return RecordedEdgar()
+
+@pytest.fixture(params=[filing["ticker"] for filing in _load_manifest()])
+def filing(request, recorded_edgar):
+    return next(f for f in recorded_edgar.filings if f["ticker"] == request.param)
+
+@pytest.fixture
+def clear_caches(tmp_path, monkeypatch):
+    """Point every cache at a fresh directory. Returns a function that empties them again."""
+    cache_root = tmp_path / "cache"
+
+    def clear():
+        shutil.rmtree(cache_root, ignore_errors=True)
+        cache_root.mkdir()
+        monkeypatch.setattr(buffett_app, "FILING_CACHE_DIR", str(cache_root / "filings"))
+        monkeypatch.setattr(buffett_app, "SECTION_CACHE_DIR", str(cache_root / "sections"))
+        monkeypatch.setattr(buffett_app, "AUDIO_CACHE_DIR", str(cache_root / "audio"))
+        monkeypatch.setattr(buffett_app, "SINGLEFLIGHT_LOCK_DIR", str(cache_root / "locks"))
+        monkeypatch.setattr(buffett_app, "CACHE_DB_PATH", str(cache_root / "buffett.sqlite3"))
+        buffett_app._db_initialized.discard(str(cache_root / "buffett.sqlite3"))
+
+    clear()
+    return clear
+
+@pytest.fixture
+def app_env(recorded_edgar, clear_caches, monkeypatch):
+    """buffett_app wired to recorded EDGAR responses, a stub Gemini client and empty caches."""
+    monkeypatch.setattr(buffett_app.sec_session, "get", recorded_edgar.get)
+    monkeypatch.setattr(buffett_app, "client", FakeGeminiClient())
+    monkeypatch.setattr(buffett_app, "_ticker_index", {})
+    monkeypatch.setattr(buffett_app, "_ticker_index_validators", {"etag": None, "last_modified": None})
+    monkeypatch.setattr(buffett_app, "_ticker_index_retry_at", 0.0)
+    buffett_app._cache_stats.clear()
+    return buffett_app
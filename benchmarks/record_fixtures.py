@@ -0,0 +1,228 @@
+"""
+Record EDGAR fixtures for the offline benchmark suite.
+
+    python benchmarks/record_fixtures.py AAPL JPM      # fetch real filings from sec.gov once
+    python benchmarks/record_fixtures.py --synthetic   # regenerate the checked-in synthetic filing
+
+Recorded files are written to benchmarks/fixtures/ and listed in manifest.json:
+  company_tickers.json            subset of https://www.sec.gov/files/company_tickers.json
+  submissions/CIK##########.json  https://data.sec.gov/submissions/CIK##########.json
+  filings/<cik>-<accession>-<document>.gz  gzip-compressed primary 10-K document
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+import requests
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+MANIFEST_PATH = os.path.join(FIXTURES_DIR, "manifest.json")
+USER_AGENT = os.getenv("SEC_USER_AGENT", "Matthew matthew@example.com")
+
+SYNTHETIC_TICKER = "BUFX"
+SYNTHETIC_CIK = "0009999999"
+SYNTHETIC_ACCESSION = "0009999999-24-000001"
+SYNTHETIC_DOCUMENT = "bufx-20241231.htm"
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"filings": []}
+
+def save_manifest(manifest):
+    manifest["filings"].sort(key=lambda entry: entry["ticker"])
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+def update_company_tickers(entries):
+    path = os.path.join(FIXTURES_DIR, "company_tickers.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        data = {}
+    known = {entry["ticker"]: entry for entry in data.values()}
+    for entry in entries:
+        known[entry["ticker"]] = entry
+    data = {str(i): entry for i, entry in enumerate(sorted(known.values(), key=lambda e: e["ticker"]))}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+def write_filing(cik, accession, document, content):
+    os.makedirs(os.path.join(FIXTURES_DIR, "filings"), exist_ok=True)
+    name = f"{cik}-{accession}-{document}.gz"
+    # mtime=0 keeps the gzip output byte-identical between runs
+    with gzip.GzipFile(os.path.join(FIXTURES_DIR, "filings", name), "wb", compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return f"filings/{name}"
+
+def write_submissions(cik, data):
+    os.makedirs(os.path.join(FIXTURES_DIR, "submissions"), exist_ok=True)
+    with open(os.path.join(FIXTURES_DIR, "submissions", f"CIK{cik}.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def record_ticker(session, ticker, tickers):
+    entry = next((e for e in tickers.values() if e["ticker"].upper() == ticker.upper()), None)
+    if entry is None:
+        print(f"{ticker}: not found in company_tickers.json", file=sys.stderr)
+        return None
+    cik = str(entry["cik_str"]).zfill(10)
+
+    time.sleep(0.2)
+    submissions = session.get(f"https://data.sec.gov/submissions/CIK{cik}.json", timeout=30)
+    submissions.raise_for_status()
+    data = submissions.json()
+    recent = data["filings"]["recent"]
+    try:
+        i = recent["form"].index("10-K")
+    except ValueError:
+        print(f"{ticker}: no 10-K in recent filings", file=sys.stderr)
+        return None
+    accession = recent["accessionNumber"][i]
+    document = recent["primaryDocument"][i]
+
+    time.sleep(0.2)
+    url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}/{document}"
+    filing = session.get(url, timeout=60)
+    filing.raise_for_status()
+
+    write_submissions(cik, data)
+    path = write_filing(cik, accession, document, filing.content)
+    print(f"{ticker}: recorded {len(filing.content)} bytes from {url}")
+    return entry, {"ticker": entry["ticker"], "cik": cik, "accession": accession,
+                   "primary_document": document, "file": path}
+
+def synthetic_10k_html(seed=10):
+    """Build a deterministic inline-XBRL 10-K of realistic size and structure."""
+    rng = random.Random(seed)
+    words = ("company revenue customers products services market competition risk operations "
+             "financial results growth margin capital liquidity cash flow debt interest rates "
+             "regulation supply chain manufacturing demand pricing inventory segment employees "
+             "technology intellectual property litigation tax acquisitions dividends shareholders").split()
+
+    def paragraph(n=120):
+        sentences = []
+        while n > 0:
+            length = rng.randint(12, 30)
+            sentence = " ".join(rng.choice(words) for _ in range(length))
+            sentences.append(sentence.capitalize() + ".")
+            n -= length
+        return " ".join(sentences)
+
+    items = [
+        ("1", "Business", 120), ("1A", "Risk Factors", 320), ("1B", "Unresolved Staff Comments", 2),
+        ("1C", "Cybersecurity", 12), ("2", "Properties", 6), ("3", "Legal Proceedings", 8),
+        ("4", "Mine Safety Disclosures", 1), ("5", "Market for Registrant&#8217;s Common Equity", 15),
+        ("6", "[Reserved]", 1), ("7", "Management&#8217;s Discussion and Analysis", 260),
+        ("7A", "Quantitative and Qualitative Disclosures About Market Risk", 20),
+        ("8", "Financial Statements and Supplementary Data", 300), ("9", "Changes in and Disagreements", 2),
+        ("9A", "Controls and Procedures", 12), ("9B", "Other Information", 3), ("15", "Exhibits", 10),
+    ]
+
+    out = ['<?xml version="1.0" encoding="utf-8"?>',
+           '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL" '
+           'xmlns:xbrli="http://www.xbrl.org/2003/instance">',
+           "<head><title>bufx-20241231</title><style>div{font-family:Times New Roman}</style>"
+           "<script>var loaded = true;</script></head><body>"]
+
+    # Hidden iXBRL header with thousands of contexts, as in real filings
+    out.append('<div style="display:none"><ix:header><ix:hidden>')
+    for i in range(400):
+        out.append(f'<ix:nonNumeric name="dei:Hidden{i}" contextRef="c-{i}">hidden value {i}</ix:nonNumeric>')
+    out.append("</ix:hidden><ix:resources>")
+    for i in range(4000):
+        out.append(f'<xbrli:context id="c-{i}"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">'
+                   f'{SYNTHETIC_CIK}</xbrli:identifier></xbrli:entity><xbrli:period><xbrli:startDate>2024-01-01'
+                   f'</xbrli:startDate><xbrli:endDate>2024-12-31</xbrli:endDate></xbrli:period></xbrli:context>')
+    out.append("</ix:resources></ix:header></div>")
+
+    out.append('<div><span style="font-weight:bold">TABLE OF CONTENTS</span></div><table>')
+    for number, title, _ in items:
+        out.append(f"<tr><td><span>Item {number}.</span></td><td><span>{title}</span></td>"
+                   f"<td><span>{rng.randint(1, 120)}</span></td></tr>")
+    out.append("</table>")
+
+    for number, title, paragraphs in items:
+        out.append(f'<div style="margin-top:12pt"><span style="font-weight:bold">Item {number}.&#160;&#160;'
+                   f'{title}</span></div>')
+        for p in range(paragraphs):
+            if p % 25 == 0 and paragraphs > 25:
+                out.append(f'<div><span style="font-style:italic">{paragraph(6).rstrip(".")}</span></div>')
+            out.append(f'<div style="text-align:justify"><span>{paragraph()}</span></div>')
+            if number == "8" and p % 10 == 0:
+                out.append("<table>")
+                for row in range(12):
+                    out.append(f"<tr><td><span>{paragraph(4)}</span></td>"
+                               f'<td><ix:nonFraction name="us-gaap:Revenues" contextRef="c-{row}" unitRef="usd" '
+                               f'decimals="-6" scale="6">{rng.randint(100, 99999):,}</ix:nonFraction></td></tr>')
+                out.append("</table>")
+
+    out.append("</body></html>")
+    return "\n".join(out).encode("utf-8")
+
+def record_synthetic():
+    content = synthetic_10k_html()
+    path = write_filing(SYNTHETIC_CIK, SYNTHETIC_ACCESSION, SYNTHETIC_DOCUMENT, content)
+    write_submissions(SYNTHETIC_CIK, {
+        "cik": SYNTHETIC_CIK,
+        "name": "Buffett Synthetic Holdings Inc",
+        "tickers": [SYNTHETIC_TICKER],
+        "filings": {
+            "recent": {
+                "accessionNumber": ["0009999999-25-000003", "0009999999-25-000002", SYNTHETIC_ACCESSION],
+                "filingDate": ["2025-04-30", "2025-03-15", "2025-02-14"],
+                "reportDate": ["2025-03-31", "2025-03-15", "2024-12-31"],
+                "form": ["10-Q", "8-K", "10-K"],
+                "primaryDocument": ["bufx-20250331.htm", "bufx-8k.htm", SYNTHETIC_DOCUMENT],
+            },
+            "files": [],
+        },
+    })
+    print(f"{SYNTHETIC_TICKER}: generated {len(content)} bytes of synthetic 10-K HTML")
+    return ({"cik_str": int(SYNTHETIC_CIK), "ticker": SYNTHETIC_TICKER, "title": "Buffett Synthetic Holdings Inc"},
+            {"ticker": SYNTHETIC_TICKER, "cik": SYNTHETIC_CIK, "accession": SYNTHETIC_ACCESSION,
+             "primary_document": SYNTHETIC_DOCUMENT, "file": path})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("tickers", nargs="*", help="tickers whose latest 10-K should be recorded")
+    parser.add_argument("--synthetic", action="store_true", help="regenerate the synthetic filing")
+    args = parser.parse_args()
+    if not args.tickers and not args.synthetic:
+        parser.error("give at least one ticker or --synthetic")
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    manifest = load_manifest()
+    recorded = []
+
+    if args.synthetic:
+        recorded.append(record_synthetic())
+
+    if args.tickers:
+        session = requests.Session()
+        session.headers["User-Agent"] = USER_AGENT
+        response = session.get("https://www.sec.gov/files/company_tickers.json", timeout=30)
+        response.raise_for_status()
+        tickers = response.json()
+        for ticker in args.tickers:
+            result = record_ticker(session, ticker, tickers)
+            if result:
+                recorded.append(result)
+
+    update_company_tickers(entry for entry, _ in recorded)
+    by_ticker = {entry["ticker"]: entry for entry in manifest["filings"]}
+    for _, filing in recorded:
+        by_ticker[filing["ticker"]] = filing
+    manifest["filings"] = list(by_ticker.values())
+    save_manifest(manifest)
+
+if __name__ == "__main__":
+    main()
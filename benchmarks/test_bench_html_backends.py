@@ -0,0 +1,17 @@
+"""Compare HTML_TEXT_BACKEND implementations on the recorded filings."""
+import pytest
+
+import buffett_app
+
+@pytest.fixture(scope="module")
+def reference_texts(recorded_edgar):
+    return {f["ticker"]: buffett_app.html_to_text(f["html"], "html.parser") for f in recorded_edgar.filings}
+
+@pytest.mark.parametrize("backend", buffett_app.HTML_TEXT_BACKENDS)
+def test_html_to_text(benchmark, backend, filing, reference_texts):
+    if buffett_app.resolve_html_backend(backend) != backend:
+        pytest.skip(f"{backend} backend is not available")
+    benchmark.group = f"html_to_text[{filing['ticker']}]"
+    text = benchmark.pedantic(buffett_app.html_to_text, args=(filing["html"], backend), rounds=3)
+    # lxml drops whitespace outside <html>, otherwise every backend yields identical text
+    assert text.strip() == reference_texts[filing["ticker"]].strip()
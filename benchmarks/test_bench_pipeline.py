@@ -0,0 +1,57 @@
+"""Per-stage and end-to-end timings for the analysis pipeline against recorded fixtures."""
+from urllib.parse import quote
+
+def test_refresh_ticker_index(benchmark, app_env):
+    assert benchmark(app_env.refresh_ticker_index)
+
+def test_get_cik(benchmark, app_env, filing):
+    app_env.ensure_ticker_index()
+    assert benchmark(app_env.get_cik, filing["ticker"].lower()) == filing["cik"]
+
+def test_get_latest_10k_url_cold(benchmark, app_env, clear_caches, filing):
+    url = benchmark.pedantic(app_env.get_latest_10k_url, args=(filing["cik"],), setup=clear_caches, rounds=5)
+    assert url == filing["url"]
+
+def test_get_latest_10k_url_warm(benchmark, app_env, recorded_edgar, filing):
+    app_env.get_latest_10k_url(filing["cik"])
+    requests_made = recorded_edgar.requests
+    assert benchmark(app_env.get_latest_10k_url, filing["cik"]) == filing["url"]
+    assert recorded_edgar.requests == requests_made
+
+def test_fetch_10k_text_cold(benchmark, app_env, clear_caches, filing):
+    text = benchmark.pedantic(app_env.fetch_10k_text, args=(filing["url"],), setup=clear_caches, rounds=5)
+    assert text
+
+def test_fetch_10k_text_warm(benchmark, app_env, filing):
+    app_env.fetch_10k_text(filing["url"])
+    assert benchmark(app_env.fetch_10k_text, filing["url"])
+
+def test_extract_sections(benchmark, app_env, filing):
+    text = app_env.fetch_10k_text(filing["url"])
+    sections = benchmark(app_env.extract_sections, text)
+    assert "Risk Factors" in sections
+
+def test_get_10k_sections_warm(benchmark, app_env, filing):
+    app_env.get_10k_sections(filing["url"])
+    assert "Business" in benchmark(app_env.get_10k_sections, filing["url"])
+
+def test_analyze_route_cold(benchmark, app_env, clear_caches, filing):
+    client = app_env.app.test_client()
+    url = f"/analyze/10k/{filing['ticker']}/{quote('risk factors')}"
+
+    def setup():
+        clear_caches()
+        app_env.ensure_ticker_index()
+
+    response = benchmark.pedantic(client.get, args=(url,), setup=setup, rounds=5)
+    assert response.status_code == 200
+
+def test_analyze_route_warm(benchmark, app_env, filing):
+    """Requests/second for a fully cached analysis (see the OPS column)."""
+    client = app_env.app.test_client()
+    url = f"/analyze/10k/{filing['ticker']}/{quote('risk factors')}"
+    assert client.get(url).status_code == 200
+    gemini_calls = app_env.client.models.calls
+    response = benchmark(client.get, url)
+    assert response.status_code == 200
+    assert app_env.client.models.calls == gemini_calls
@@ -1,15 +1,52 @@
 import os
+import click
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-from flask import Flask, jsonify, send_file, request, render_template
+from bs4.dammit import EncodingDetector
+from flask import Flask, Response, jsonify, send_file, request, render_template, stream_with_context
 from google import genai
 from google.genai import types
+import prometheus_client
+from prometheus_client import multiprocess
 import re
+import bisect
+import codecs
+import contextlib
+import contextvars
+import datetime
+import email.utils
+import functools
+import sqlite3
+import tempfile
 import uuid
-import base64
+import gzip
+import hashlib
 import io
+import itertools
+import json
 import logging
+import shutil
+import threading
+import time
+import wave
+import zipfile
+import numpy as np
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:  # optional, only needed for HTML_TEXT_BACKEND=lxml
+    lxml = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process rate limit
+    fcntl = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -28,73 +65,891 @@ if not GEMINI_API_KEY:
 
 client = genai.Client(api_key=GEMINI_API_KEY)
 
+# Prometheus metrics served at /metrics. With several worker processes set PROMETHEUS_MULTIPROC_DIR
+# so samples from every worker are aggregated (prometheus_client reads it at import time).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = prometheus_client.Histogram(
+    "buffett_stage_duration_seconds", "Time spent in each pipeline stage", ["stage", "section"],
+    buckets=_LATENCY_BUCKETS)
+CACHE_LOOKUPS = prometheus_client.Counter(
+    "buffett_cache_lookups_total", "Local cache lookups by cache and result", ["cache", "result"])
+SEC_DOWNLOADED_BYTES = prometheus_client.Counter(
+    "buffett_sec_downloaded_bytes_total", "Bytes downloaded from sec.gov", ["kind"])
+GEMINI_TOKENS = prometheus_client.Counter(
+    "buffett_gemini_tokens_total", "Gemini tokens by direction (input includes cached)", ["direction", "model"])
+ANALYSES_IN_PROGRESS = prometheus_client.Gauge(
+    "buffett_analyses_in_progress", "Analyses currently running", ["section"], multiprocess_mode="livesum")
+
+# Section being analyzed by the current request, used to label stage timings
+metrics_section = contextvars.ContextVar("metrics_section", default="none")
+
+def metrics_section_label(section):
+    """Known 10-K section names are used as-is; anything else is bucketed to keep label cardinality bounded."""
+    section = section.strip().lower()
+    if any(section == name.lower() for _, name, _ in TEN_K_ITEMS + TEN_K_FORMER_ITEMS):
+        return section
+    return "other"
+
+@contextlib.contextmanager
+def observe_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage, metrics_section.get()).observe(time.perf_counter() - start)
+
+def timed_stage(stage):
+    """Decorator recording the duration of every call in the stage latency histogram."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with observe_stage(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_gemini_usage(response, model):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    GEMINI_TOKENS.labels("input", model).inc(getattr(usage, "prompt_token_count", None) or 0)
+    GEMINI_TOKENS.labels("output", model).inc(getattr(usage, "candidates_token_count", None) or 0)
+    GEMINI_TOKENS.labels("cached", model).inc(getattr(usage, "cached_content_token_count", None) or 0)
+
 headers = {"User-Agent": "Matthew matthew@example.com"}
 
-def get_cik(ticker):
-    """Resolve ticker to CIK using SEC API."""
+# Shared connection pool for sec.gov / data.sec.gov with SEC's fair-access rate limit
+SEC_MAX_REQUESTS_PER_SECOND = float(os.getenv("SEC_MAX_REQUESTS_PER_SECOND", "10"))
+SEC_RATE_LIMIT_FILE = os.getenv("SEC_RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "buffett-sec-rate-limit"))
+SEC_POOL_SIZE = int(os.getenv("SEC_POOL_SIZE", "20"))
+SEC_RETRY_STATUSES = (429, 503)
+SEC_MAX_RETRIES = 3
+
+sec_session = requests.Session()
+sec_session.headers.update(headers)
+sec_session.headers["Accept-Encoding"] = "gzip, deflate"
+_sec_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=SEC_POOL_SIZE,
+    # Only connection failures are retried here: a request that never reached sec.gov uses no
+    # budget. Throttled responses are retried by sec_get, which takes a token for each attempt.
+    max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5, allowed_methods=("GET", "HEAD")),
+)
+sec_session.mount("https://", _sec_adapter)
+
+_sec_bucket = {"tokens": SEC_MAX_REQUESTS_PER_SECOND, "updated": time.monotonic()}
+_sec_bucket_lock = threading.Lock()
+
+def _refill(tokens, updated, now):
+    return min(SEC_MAX_REQUESTS_PER_SECOND, tokens + (now - updated) * SEC_MAX_REQUESTS_PER_SECOND)
+
+def take_sec_token():
+    """
+    Try to take one token from the SEC rate limit bucket.
+    Returns 0 if a token was taken, otherwise the number of seconds to wait before retrying.
+    The bucket lives in a lock-protected file so all workers on the host share it.
+    """
+    with _sec_bucket_lock:
+        if fcntl is None or not SEC_RATE_LIMIT_FILE:
+            now = time.monotonic()
+            tokens = _refill(_sec_bucket["tokens"], _sec_bucket["updated"], now)
+            _sec_bucket["updated"] = now
+            if tokens >= 1:
+                _sec_bucket["tokens"] = tokens - 1
+                return 0
+            _sec_bucket["tokens"] = tokens
+            return (1 - tokens) / SEC_MAX_REQUESTS_PER_SECOND
+
+        # time.time() rather than monotonic, since the state is shared between processes
+        with open(SEC_RATE_LIMIT_FILE, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                now = time.time()
+                try:
+                    tokens, updated = (float(v) for v in f.read().split())
+                    tokens = _refill(tokens, min(updated, now), now)
+                except ValueError:
+                    tokens = SEC_MAX_REQUESTS_PER_SECOND
+                wait = 0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / SEC_MAX_REQUESTS_PER_SECOND
+                f.seek(0)
+                f.truncate()
+                f.write(f"{tokens} {now}")
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def acquire_sec_token():
+    """Block until a request to the SEC may be sent."""
+    global SEC_RATE_LIMIT_FILE
+    if SEC_MAX_REQUESTS_PER_SECOND <= 0:
+        return
+    while True:
+        try:
+            wait = take_sec_token()
+        except OSError as e:
+            logger.warning(f"Shared SEC rate limiter unavailable, falling back to per-process limit: {e}")
+            SEC_RATE_LIMIT_FILE = None
+            continue
+        if not wait:
+            return
+        time.sleep(wait)
+
+def sec_retry_delay(response, attempt):
+    """Seconds to wait before retrying a throttled SEC response: Retry-After, else exponential backoff."""
     try:
-        logger.info(f"Looking up CIK for ticker: {ticker}")
-        url = f"https://www.sec.gov/files/company_tickers.json"
-        response = requests.get(url, headers=headers, timeout=10)
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return 0.5 * 2 ** attempt
+
+def sec_get(url, **kwargs):
+    """
+    GET a sec.gov URL through the shared pooled session, honoring the SEC rate limit.
+    Throttled responses (429/503) are retried, each attempt taking its own token.
+    """
+    for attempt in range(SEC_MAX_RETRIES + 1):
+        acquire_sec_token()
+        response = sec_session.get(url, **kwargs)
+        if response.status_code not in SEC_RETRY_STATUSES or attempt == SEC_MAX_RETRIES:
+            break
+        response.close()
+        time.sleep(sec_retry_delay(response, attempt))
+    if not kwargs.get("stream"):
+        # Streamed bodies are counted by the caller as they are read
+        SEC_DOWNLOADED_BYTES.labels("metadata").inc(len(response.content))
+    return response
+
+# Ticker -> CIK index, loaded on first use and kept fresh by a background thread
+TICKER_INDEX_URL = "https://www.sec.gov/files/company_tickers.json"
+TICKER_INDEX_REFRESH_SECONDS = int(os.getenv("TICKER_INDEX_REFRESH_SECONDS", "86400"))
+# After a failed load, requests do not try the SEC again until this much time has passed
+TICKER_INDEX_RETRY_SECONDS = int(os.getenv("TICKER_INDEX_RETRY_SECONDS", "60"))
+
+_ticker_index = {}
+_ticker_index_validators = {"etag": None, "last_modified": None}
+_ticker_index_lock = threading.Lock()
+_ticker_index_refresher = None
+_ticker_index_retry_at = 0.0
+
+def refresh_ticker_index():
+    """Refresh the ticker index using a conditional GET. Returns True if the index is usable."""
+    global _ticker_index
+    try:
+        request_headers = {}
+        if _ticker_index_validators["etag"]:
+            request_headers["If-None-Match"] = _ticker_index_validators["etag"]
+        if _ticker_index_validators["last_modified"]:
+            request_headers["If-Modified-Since"] = _ticker_index_validators["last_modified"]
+
+        response = sec_get(TICKER_INDEX_URL, headers=request_headers, timeout=10)
+        if response.status_code == 304:
+            logger.info("Ticker index not modified since last refresh")
+            return bool(_ticker_index)
         response.raise_for_status()
         data = response.json()
 
+        index = {}
         for entry in data.values():
-            if entry["ticker"].lower() == ticker.lower():
-                cik = str(entry["cik_str"]).zfill(10)
-                logger.info(f"Found CIK {cik} for ticker {ticker}")
-                return cik
+            index[entry["ticker"].upper()] = str(entry["cik_str"]).zfill(10)
+
+        # Swap in the new dict in one assignment so readers never see a partial index
+        _ticker_index = index
+        _ticker_index_validators["etag"] = response.headers.get("ETag")
+        _ticker_index_validators["last_modified"] = response.headers.get("Last-Modified")
+        logger.info(f"Loaded ticker index with {len(index)} entries")
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to refresh ticker index: {e}")
+        return bool(_ticker_index)
+    except (KeyError, AttributeError) as e:
+        logger.error(f"Unexpected data structure in ticker index response: {e}")
+        return bool(_ticker_index)
+
+def _ticker_index_refresh_loop():
+    while True:
+        # Until the first load succeeds, keep retrying at the shorter interval
+        time.sleep(TICKER_INDEX_REFRESH_SECONDS if _ticker_index else TICKER_INDEX_RETRY_SECONDS)
+        try:
+            refresh_ticker_index()
+        except Exception as e:
+            logger.error(f"Unexpected error refreshing ticker index: {e}")
+
+def ensure_ticker_index():
+    """
+    Load the ticker index on first use and start the background refresher. After a failed
+    load, returns False without touching the network until TICKER_INDEX_RETRY_SECONDS pass.
+    """
+    global _ticker_index_refresher, _ticker_index_retry_at
+    if _ticker_index and _ticker_index_refresher is not None:
+        return True
+    if not _ticker_index and time.time() < _ticker_index_retry_at:
+        return False
+    with _ticker_index_lock:
+        if not _ticker_index and time.time() >= _ticker_index_retry_at:
+            if not refresh_ticker_index():
+                _ticker_index_retry_at = time.time() + TICKER_INDEX_RETRY_SECONDS
+        if _ticker_index_refresher is None and TICKER_INDEX_REFRESH_SECONDS > 0:
+            _ticker_index_refresher = threading.Thread(
+                target=_ticker_index_refresh_loop, name="ticker-index-refresh", daemon=True)
+            _ticker_index_refresher.start()
+    return bool(_ticker_index)
+
+def lookup_ingested_cik(ticker):
+    """CIK for a ticker from a bulk submissions ingest (see `flask ingest-submissions`), or None."""
+    try:
+        conn = db_connect()
+        try:
+            row = conn.execute("SELECT cik FROM tickers WHERE ticker = ?", (ticker,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.warning(f"Ingested ticker lookup failed: {e}")
+        return None
+
+@timed_stage("get_cik")
+def get_cik(ticker):
+    """Resolve ticker to CIK using the in-memory SEC ticker index, then any bulk-ingested tickers."""
+    try:
+        logger.info(f"Looking up CIK for ticker: {ticker}")
+        ticker = ticker.strip().upper()
+        indexed = ensure_ticker_index()
+        cik = _ticker_index.get(ticker)
+        if not cik:
+            # Only after an in-memory miss, so the hot path never touches SQLite. Bulk-ingested
+            # tickers also resolve while the SEC index cannot be loaded, e.g. in offline batch runs
+            cik = lookup_ingested_cik(ticker)
+        if cik:
+            logger.info(f"Found CIK {cik} for ticker {ticker}")
+            return cik
 
+        if not indexed:
+            logger.error(f"Ticker index unavailable, cannot resolve ticker {ticker}")
+            return None
         logger.warning(f"No CIK found for ticker: {ticker}")
         return None
+    except Exception as e:
+        logger.error(f"Unexpected error in get_cik for ticker {ticker}: {e}")
+        return None
+
+# Parsed submissions metadata is kept in the cache database and only re-fetched
+# (with a conditional GET) once it is older than SUBMISSIONS_TTL_SECONDS
+SUBMISSIONS_TTL_SECONDS = int(os.getenv("SUBMISSIONS_TTL_SECONDS", "3600"))
+
+def filing_archive_url(cik, accession, primary_doc):
+    return f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}/{primary_doc}"
+
+def filing_rows(cik, filings):
+    """Turn the column-oriented arrays of a submissions 'recent' block or page into filings rows."""
+    report_dates = filings.get("reportDate") or [None] * len(filings["form"])
+    return [
+        (cik, accession, form, filing_date, report_date or None, primary_doc)
+        for accession, form, filing_date, report_date, primary_doc in zip(
+            filings["accessionNumber"], filings["form"], filings["filingDate"],
+            report_dates, filings["primaryDocument"])
+    ]
+
+def parse_submissions(cik, data):
+    """
+    Return (filings rows, submission page rows) for a submissions response. Active filers list
+    only their most recent filings inline; older ones are in separately fetched pages.
+    """
+    filings = data["filings"]
+    pages = [(cik, page["name"], page.get("filingFrom"), page.get("filingTo"))
+             for page in filings.get("files") or []]
+    return filing_rows(cik, filings["recent"]), pages
+
+def _write_submissions(conn, cik, rows, etag, last_modified, pages):
+    conn.executemany(
+        "INSERT OR REPLACE INTO filings (cik, accession, form, filing_date, report_date, primary_document) "
+        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany(
+        "INSERT OR IGNORE INTO submission_pages (cik, name, filing_from, filing_to) VALUES (?, ?, ?, ?)",
+        pages)
+    conn.execute(
+        "INSERT OR REPLACE INTO submissions (cik, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?)",
+        (cik, etag, last_modified, time.time()))
+
+def store_submissions(cik, rows, etag, last_modified, pages=()):
+    conn = db_connect()
+    try:
+        with conn:
+            _write_submissions(conn, cik, rows, etag, last_modified, pages)
+    finally:
+        conn.close()
+
+def load_submissions_state(cik):
+    """Return (etag, last_modified, fetched_at) of the last submissions fetch for a CIK, or None."""
+    conn = db_connect()
+    try:
+        return conn.execute(
+            "SELECT etag, last_modified, fetched_at FROM submissions WHERE cik = ?", (cik,)).fetchone()
+    finally:
+        conn.close()
+
+def submissions_fresh(state):
+    if state is None:
+        return False
+    return time.time() - state[2] < SUBMISSIONS_TTL_SECONDS
+
+def submissions_request(cik, state):
+    """URL and conditional request headers for refreshing a CIK's submissions."""
+    request_headers = {}
+    if state and state[0]:
+        request_headers["If-None-Match"] = state[0]
+    if state and state[1]:
+        request_headers["If-Modified-Since"] = state[1]
+    return f"https://data.sec.gov/submissions/CIK{cik}.json", request_headers
+
+def touch_submissions(cik):
+    conn = db_connect()
+    try:
+        with conn:
+            conn.execute("UPDATE submissions SET fetched_at = ? WHERE cik = ?", (time.time(), cik))
+    finally:
+        conn.close()
+
+def _refresh_submissions(cik, force=False):
+    state = load_submissions_state(cik)
+    if not force and submissions_fresh(state):
+        return True
+
+    try:
+        url, request_headers = submissions_request(cik, state)
+        response = sec_get(url, headers=request_headers, timeout=10)
+        if response.status_code == 304:
+            logger.info(f"Submissions for CIK {cik} not modified since last refresh")
+            touch_submissions(cik)
+            return True
+        response.raise_for_status()
+        rows, pages = parse_submissions(cik, response.json())
+    except requests.exceptions.RequestException as e:
+        # Serve whatever we already have rather than failing the request
+        logger.error(f"Failed to refresh submissions for CIK {cik}: {e}")
+        return state is not None
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Unexpected data structure in submissions response for CIK {cik}: {e}")
+        return state is not None
+
+    store_submissions(cik, rows, response.headers.get("ETag"), response.headers.get("Last-Modified"), pages)
+    logger.info(f"Indexed {len(rows)} recent filings for CIK {cik}")
+    return True
+
+def refresh_submissions(cik, force=False):
+    """
+    Bring the local submissions index for a CIK up to date. Returns True if it is usable.
+    force skips the TTL, e.g. when the daily index shows a filing we have not seen yet.
+    """
+    try:
+        return singleflight(("submissions", cik), lambda: _refresh_submissions(cik, force))
+    except sqlite3.Error as e:
+        logger.error(f"Submissions index unavailable for CIK {cik}: {e}")
+        return False
+
+def latest_10k_filing(cik):
+    """Return (accession, primary document) of the latest indexed 10-K for a CIK, or None."""
+    conn = db_connect()
+    try:
+        return conn.execute(
+            "SELECT accession, primary_document FROM filings WHERE cik = ? AND form = '10-K' "
+            "ORDER BY filing_date DESC, accession DESC LIMIT 1", (cik,)).fetchone()
+    finally:
+        conn.close()
+
+# Very old filings have no report date; they were filed in the year after the fiscal year ended
+_FISCAL_YEAR_SQL = ("COALESCE(CAST(substr(report_date, 1, 4) AS INTEGER), "
+                    "CAST(substr(filing_date, 1, 4) AS INTEGER) - 1)")
+
+def fiscal_year_10k_filing(cik, year):
+    """Return (accession, primary document) of the 10-K for the fiscal year ending in year, or None."""
+    conn = db_connect()
+    try:
+        return conn.execute(
+            "SELECT accession, primary_document FROM filings WHERE cik = ? AND form = '10-K' "
+            f"AND {_FISCAL_YEAR_SQL} = ? "
+            "ORDER BY filing_date DESC, accession DESC LIMIT 1", (cik, year)).fetchone()
+    finally:
+        conn.close()
+
+def pending_submission_pages(cik, year):
+    """Names of not yet loaded submissions pages that may list the 10-K for fiscal year year, newest first."""
+    conn = db_connect()
+    try:
+        rows = conn.execute(
+            "SELECT name FROM submission_pages WHERE cik = ? AND loaded_at IS NULL "
+            "AND COALESCE(filing_from, '') <= ? AND COALESCE(filing_to, '9999') >= ? "
+            "ORDER BY filing_to DESC", (cik, f"{year + 1}-12-31", f"{year}-01-01")).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+def _write_submission_page(conn, cik, name, rows):
+    # Rows from the inline recent block are fresher, so they win over page rows
+    conn.executemany(
+        "INSERT OR IGNORE INTO filings (cik, accession, form, filing_date, report_date, primary_document) "
+        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    # A bulk ingest may load a page before the submissions file that lists it
+    conn.execute(
+        "INSERT INTO submission_pages (cik, name, loaded_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (cik, name) DO UPDATE SET loaded_at = excluded.loaded_at", (cik, name, time.time()))
+
+def store_submission_page(cik, name, rows):
+    conn = db_connect()
+    try:
+        with conn:
+            _write_submission_page(conn, cik, name, rows)
+    finally:
+        conn.close()
+
+def submission_page_url(name):
+    return f"https://data.sec.gov/submissions/{name}"
+
+def _load_submission_page(cik, name):
+    try:
+        response = sec_get(submission_page_url(name), timeout=30)
+        response.raise_for_status()
+        rows = filing_rows(cik, response.json())
     except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch CIK data for ticker {ticker}: {e}")
+        logger.error(f"Failed to fetch submissions page {name}: {e}")
+        return False
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Unexpected data structure in submissions page {name}: {e}")
+        return False
+
+    # Pages only cover past filings and never change, so each is fetched once
+    store_submission_page(cik, name, rows)
+    logger.info(f"Indexed {len(rows)} older filings for CIK {cik} from {name}")
+    return True
+
+def load_submission_page(cik, name):
+    return singleflight(("submission-page", cik, name), lambda: _load_submission_page(cik, name))
+
+@timed_stage("get_10k_url_for_year")
+def get_10k_url_for_year(cik, year):
+    """Fetch the URL of a company's 10-K for the fiscal year ending in year."""
+    try:
+        logger.info(f"Fetching {year} 10-K URL for CIK: {cik}")
+        if not refresh_submissions(cik):
+            return None
+
+        row = fiscal_year_10k_filing(cik, year)
+        if row is None:
+            for name in pending_submission_pages(cik, year):
+                if load_submission_page(cik, name):
+                    row = fiscal_year_10k_filing(cik, year)
+                    if row:
+                        break
+
+        if row:
+            archive_url = filing_archive_url(cik, row[0], row[1])
+            logger.info(f"Found {year} 10-K URL: {archive_url}")
+            return archive_url
+
+        logger.warning(f"No {year} 10-K found for CIK: {cik}")
         return None
-    except KeyError as e:
-        logger.error(f"Unexpected data structure in CIK response for ticker {ticker}: {e}")
+    except sqlite3.Error as e:
+        logger.error(f"Submissions index lookup failed for CIK {cik}: {e}")
         return None
     except Exception as e:
-        logger.error(f"Unexpected error in get_cik for ticker {ticker}: {e}")
+        logger.error(f"Unexpected error in get_10k_url_for_year for CIK {cik}: {e}")
         return None
 
+@timed_stage("get_latest_10k_url")
 def get_latest_10k_url(cik):
     """Fetch latest 10-K filing URL for a company."""
     try:
         logger.info(f"Fetching latest 10-K URL for CIK: {cik}")
-        url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        if not refresh_submissions(cik):
+            return None
 
-        forms = data["filings"]["recent"]["form"]
-        for i, form in enumerate(forms):
-            if form == "10-K":
-                accession = data["filings"]["recent"]["accessionNumber"][i]
-                primary_doc = data["filings"]["recent"]["primaryDocument"][i]
-                archive_url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}/{primary_doc}"
-                logger.info(f"Found 10-K URL: {archive_url}")
-                return archive_url
+        row = latest_10k_filing(cik)
+        if row:
+            archive_url = filing_archive_url(cik, row[0], row[1])
+            logger.info(f"Found 10-K URL: {archive_url}")
+            return archive_url
 
         logger.warning(f"No 10-K found for CIK: {cik}")
         return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch 10-K data for CIK {cik}: {e}")
-        return None
-    except KeyError as e:
-        logger.error(f"Unexpected data structure in 10-K response for CIK {cik}: {e}")
+    except sqlite3.Error as e:
+        logger.error(f"Submissions index lookup failed for CIK {cik}: {e}")
         return None
     except Exception as e:
         logger.error(f"Unexpected error in get_latest_10k_url for CIK {cik}: {e}")
         return None
 
+# Hit/miss counters for the local caches, exposed via /cache/stats
+_cache_stats = {}
+_cache_stats_lock = threading.Lock()
+
+def record_cache_result(cache_name, hit):
+    with _cache_stats_lock:
+        stats = _cache_stats.setdefault(cache_name, {"hits": 0, "misses": 0})
+        stats["hits" if hit else "misses"] += 1
+    CACHE_LOOKUPS.labels(cache_name, "hit" if hit else "miss").inc()
+
+# Single-flight deduplication: concurrent callers with the same key share one computation.
+# Within a process followers wait on the leader's result; across workers on the same host
+# leaders serialize on a lock file, and later leaders then find the result in the caches.
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR", os.path.join(".cache", "locks"))
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _host_lock(key):
+    if fcntl is None or not SINGLEFLIGHT_LOCK_DIR:
+        yield
+        return
+    name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+    path = os.path.join(SINGLEFLIGHT_LOCK_DIR, f"{name}.lock")
+    try:
+        os.makedirs(SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+        while True:
+            f = open(path, "a")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            # The previous holder removed this file after we opened it; lock the current one
+            f.close()
+    except OSError as e:
+        logger.warning(f"Cross-worker lock unavailable for {key}: {e}")
+        yield
+        return
+    with f:
+        try:
+            yield
+        finally:
+            # Remove the file while still holding it so lock files do not pile up, one per key
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def singleflight(key, fn):
+    """Call fn(), unless a call with the same key is already in flight, in which case wait for its result."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = {"done": threading.Event(), "result": None, "error": None}
+
+    if not leader:
+        logger.info(f"Waiting on in-flight computation for {key}")
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["result"]
+
+    try:
+        with _host_lock(key):
+            flight["result"] = fn()
+        return flight["result"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight["done"].set()
+
+# Compressed on-disk cache of raw filing documents, keyed by CIK + accession number
+FILING_CACHE_DIR = os.getenv("FILING_CACHE_DIR", os.path.join(".cache", "filings"))
+FILING_CACHE_MAX_BYTES = int(os.getenv("FILING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+_filing_cache_lock = threading.Lock()
+_FILING_URL_RE = re.compile(r"/Archives/edgar/data/(\d+)/(\d{18})/")
+
+def parse_filing_url(url):
+    """Return (cik, accession) for an EDGAR archive URL, or None if it is not one."""
+    match = _FILING_URL_RE.search(url)
+    if not match:
+        return None
+    cik, accession = match.groups()
+    return cik.zfill(10), f"{accession[:10]}-{accession[10:12]}-{accession[12:]}"
+
+def filing_cache_path(url):
+    parsed = parse_filing_url(url)
+    if parsed:
+        cik, accession = parsed
+        name = f"{cik}-{accession}-{os.path.basename(url)}"
+    else:
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(FILING_CACHE_DIR, f"{name}.gz")
+
+FILING_CHUNK_SIZE = 256 * 1024
+
+def _iter_cached_filing(path):
+    try:
+        with gzip.open(path, "rb") as f:
+            while True:
+                chunk = f.read(FILING_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    except (OSError, EOFError):
+        logger.warning(f"Discarding unreadable filing cache entry {path}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+def lookup_cached_filing(url):
+    """Return the filing cache path for url if the filing is cached, else None, counting the lookup."""
+    path = filing_cache_path(url)
+    if not os.path.exists(path):
+        record_cache_result("filings", False)
+        return None
+    record_cache_result("filings", True)
+    logger.info(f"Filing cache hit for {url}")
+    try:
+        # Bump mtime so eviction treats the file as recently used
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+def iter_filing_chunks(url):
+    """
+    Yield the raw document for url in chunks, from the filing cache when present.
+    On a miss the download is streamed and written to the cache as it arrives.
+    """
+    path = lookup_cached_filing(url)
+    if path:
+        yield from _iter_cached_filing(path)
+        return
+
+    path = filing_cache_path(url)
+    response = sec_get(url, timeout=30, stream=True)
+    try:
+        response.raise_for_status()
+        cache_file = None
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        if FILING_CACHE_MAX_BYTES > 0:
+            try:
+                os.makedirs(FILING_CACHE_DIR, exist_ok=True)
+                cache_file = gzip.open(tmp_path, "wb", compresslevel=6)
+            except OSError as e:
+                logger.warning(f"Failed to open filing cache entry for {url}: {e}")
+
+        completed = False
+        try:
+            for chunk in response.iter_content(FILING_CHUNK_SIZE):
+                SEC_DOWNLOADED_BYTES.labels("filing").inc(len(chunk))
+                if cache_file is not None:
+                    try:
+                        cache_file.write(chunk)
+                    except OSError as e:
+                        logger.warning(f"Failed to write filing cache entry for {url}: {e}")
+                        cache_file.close()
+                        cache_file = None
+                        os.remove(tmp_path)
+                yield chunk
+            completed = True
+        finally:
+            if cache_file is not None:
+                cache_file.close()
+                if completed:
+                    os.replace(tmp_path, path)
+                    evict_filing_cache()
+                    purge_summary_stores()
+                else:
+                    os.remove(tmp_path)
+    finally:
+        response.close()
+
+def evict_filing_cache():
+    """Remove least recently used filings until the cache fits FILING_CACHE_MAX_BYTES."""
+    with _filing_cache_lock:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(FILING_CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.name.endswith(".gz"):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except FileNotFoundError:
+            return
+
+        if total <= FILING_CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= FILING_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"Evicted {path} from filing cache")
+            except FileNotFoundError:
+                total -= size
+            except OSError as e:
+                logger.warning(f"Failed to evict {path} from filing cache: {e}")
+
+# HTML-to-text backends for 10-K documents, selected with HTML_TEXT_BACKEND.
+# All produce get_text(separator="\n")-style output and skip script/style and the
+# hidden inline-XBRL header (thousands of contexts that are never shown to readers).
+# lxml and stream parse incrementally, so neither the raw HTML nor a DOM is held in memory.
+HTML_TEXT_BACKEND = os.getenv("HTML_TEXT_BACKEND", "lxml")
+HTML_TEXT_BACKENDS = ("html.parser", "lxml", "stream")
+_SKIPPED_TAGS = ("script", "style", "ix:header")
+_ENCODING_SNIFF_BYTES = 4096
+
+def _detect_encoding(head):
+    """Return the encoding declared in the first bytes of an HTML document, defaulting to UTF-8."""
+    declared = EncodingDetector.find_declared_encoding(head, is_html=True, search_entire_document=True)
+    try:
+        return codecs.lookup(declared).name if declared else "utf-8"
+    except LookupError:
+        return "utf-8"
+
+class _TextCollector:
+    """Collects text nodes between tag events, skipping the contents of _SKIPPED_TAGS."""
+
+    def __init__(self):
+        self.parts = []
+        self._pending = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        if self._pending:
+            self.parts.append("".join(self._pending))
+            self._pending = []
+
+    def start(self, tag, attrs):
+        self._flush()
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag in _SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def data(self, data):
+        if not self._skip_depth:
+            self._pending.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def close(self):
+        self._flush()
+
+    def drain(self):
+        parts, self.parts = self.parts, []
+        return parts
+
+class _StreamTextParser(HTMLParser):
+    """Tokenizer that feeds text nodes to a _TextCollector without building a tree."""
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def handle_comment(self, data):
+        self.collector.comment(data)
+
+def _sniff_chunks(chunks):
+    """Buffer enough leading bytes to detect the encoding. Returns (encoding, chunk iterator)."""
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= _ENCODING_SNIFF_BYTES:
+            break
+    return _detect_encoding(head[:_ENCODING_SNIFF_BYTES]), itertools.chain([head], chunks)
+
+def _iter_text_stream(chunks):
+    encoding, chunks = _sniff_chunks(chunks)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    collector = _TextCollector()
+    parser = _StreamTextParser(collector)
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from collector.drain()
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    collector.close()
+    yield from collector.drain()
+
+def _iter_text_lxml(chunks):
+    encoding, chunks = _sniff_chunks(chunks)
+    collector = _TextCollector()
+    # A parser target receives SAX-style events, so lxml never builds a tree
+    parser = lxml.etree.HTMLParser(target=collector, encoding=encoding)
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from collector.drain()
+    parser.close()
+    yield from collector.drain()
+
+def _iter_text_bs4(chunks):
+    # BeautifulSoup cannot parse incrementally, so this backend buffers the whole document
+    soup = BeautifulSoup(b"".join(chunks), "html.parser")
+    for tag in soup.find_all(_SKIPPED_TAGS):
+        tag.decompose()
+    yield soup.get_text(separator="\n")
+
+_HTML_TEXT_FUNCTIONS = {
+    "html.parser": _iter_text_bs4,
+    "lxml": _iter_text_lxml,
+    "stream": _iter_text_stream,
+}
+
+def resolve_html_backend(backend=None):
+    """Return a usable backend name, falling back to html.parser if the requested one is unavailable."""
+    backend = backend or HTML_TEXT_BACKEND
+    if backend not in _HTML_TEXT_FUNCTIONS:
+        logger.warning(f"Unknown HTML_TEXT_BACKEND '{backend}', using html.parser")
+        return "html.parser"
+    if backend == "lxml" and lxml is None:
+        logger.warning("lxml is not installed, using html.parser")
+        return "html.parser"
+    return backend
+
+def iter_html_text(chunks, backend=None):
+    """Yield the text nodes of an HTML document given as an iterable of byte chunks."""
+    return _HTML_TEXT_FUNCTIONS[resolve_html_backend(backend)](chunks)
+
+def html_to_text(content, backend=None):
+    """Convert raw HTML bytes to newline-separated text using the configured backend."""
+    return "\n".join(iter_html_text([content], backend))
+
+def iter_10k_text(url):
+    """Stream a 10-K from the filing cache or EDGAR, yielding its text nodes as they are parsed."""
+    return iter_html_text(iter_filing_chunks(url))
+
+@timed_stage("fetch_10k_text")
 def fetch_10k_text(url):
     """Fetch raw text from EDGAR 10-K filing URL."""
     try:
         logger.info(f"Fetching 10-K text from URL: {url}")
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        text = soup.get_text(separator="\n")
+        text = "\n".join(iter_10k_text(url))
         logger.info(f"Successfully fetched {len(text)} characters of 10-K text")
         return text
     except requests.exceptions.Timeout as e:
@@ -107,55 +962,232 @@ def fetch_10k_text(url):
         logger.error(f"Unexpected error in fetch_10k_text for URL {url}: {e}")
         return None
 
-def extract_sections(text):
+def cached_10k_text(url):
     """
-    Extract major narrative sections from a 10-K filing using regex.
-    Returns a dictionary with section names and full text.
+    fetch_10k_text for a filing already downloaded into the filing cache, e.g. by buffett_asgi.
+    The download counted the cache lookup, so this read does not.
     """
     try:
-        logger.info("Extracting sections from 10-K text")
-        sections = {}
+        text = "\n".join(iter_html_text(_iter_cached_filing(filing_cache_path(url))))
+        logger.info(f"Read {len(text)} characters of 10-K text from the filing cache")
+        return text
+    except Exception as e:
+        logger.error(f"Failed to read cached 10-K for URL {url}: {e}")
+        return None
 
-        patterns = [
-            (r"item\s+1\.*\s*business", "Business", r"item\s+1a"),
-            (r"item\s+1a\.*\s*risk\s*factors", "Risk Factors", r"item\s+1b"),
-            (r"item\s+7\.*\s*management", "Management's Discussion and Analysis", r"item\s+7a"),
-            (r"item\s+7a", "Quantitative and Qualitative Disclosures", r"item\s+8"),
-            (r"item\s+8", "Financial Statements", r"item\s+9"),
-        ]
+# 10-K Items in filing order: (item number, section name, title pattern).
+# A heading only starts a section when followed by its title; bare "Item N" mentions
+# still count as boundaries that end the preceding section.
+TEN_K_ITEMS = [
+    ("1", "Business", r"business"),
+    ("1a", "Risk Factors", r"risk\s*factors"),
+    ("1b", "Unresolved Staff Comments", r"unresolved\s+staff"),
+    ("1c", "Cybersecurity", r"cyber\s*security"),
+    ("2", "Properties", r"properties"),
+    ("3", "Legal Proceedings", r"legal\s+proceedings"),
+    ("4", "Mine Safety Disclosures", r"mine\s+safety"),
+    ("5", "Market for Registrant's Common Equity", r"market\s+for"),
+    ("6", "Reserved", r"\[?\s*reserved"),
+    ("7", "Management's Discussion and Analysis", r"management"),
+    ("7a", "Quantitative and Qualitative Disclosures", r"quantitative"),
+    ("8", "Financial Statements", r"financial\s+statements"),
+    ("9", "Changes in and Disagreements with Accountants", r"changes\s+in"),
+    ("9a", "Controls and Procedures", r"controls\s+and\s+procedures"),
+    ("9b", "Other Information", r"other\s+information"),
+    ("9c", "Disclosure Regarding Foreign Jurisdictions that Prevent Inspections", r"disclosure\s+regarding"),
+    ("10", "Directors, Executive Officers and Corporate Governance", r"directors"),
+    ("11", "Executive Compensation", r"executive\s+compensation"),
+    ("12", "Security Ownership", r"security\s+ownership"),
+    ("13", "Certain Relationships and Related Transactions", r"certain\s+relationships"),
+    ("14", "Principal Accountant Fees and Services", r"principal\s+account"),
+    ("15", "Exhibits and Financial Statement Schedules", r"exhibits"),
+    ("16", "Form 10-K Summary", r"form\s+10-k\s+summary"),
+]
 
-        for start_pattern, name, end_pattern in patterns:
-            try:
-                # Find all matches of the start pattern
-                matches = list(re.finditer(start_pattern, text, re.IGNORECASE))
-                if not matches:
-                    logger.debug(f"No matches found for section: {name}")
-                    continue
+# Former titles of Items, named after what the heading says: (item number, section name, title pattern).
+# Item 6 was "Selected Financial Data" until the SEC retired it for fiscal years ending after 2021.
+TEN_K_FORMER_ITEMS = [
+    ("6", "Selected Financial Data", r"\[?\s*selected"),
+]
 
-                # Use the *last* match (skips TOC, grabs real section body)
-                start = matches[-1].start()
+_ITEM_ORDER = {number: i for i, (number, _, _) in enumerate(TEN_K_ITEMS)}
+_ITEM_TITLES = {
+    number: [(name, re.compile(title, re.IGNORECASE))
+             for item, name, title in TEN_K_ITEMS + TEN_K_FORMER_ITEMS if item == number]
+    for number in _ITEM_ORDER
+}
+# "Item 1A." / "ITEM 7 -" / "Item 7Management": a trailing letter only belongs to the
+# item number when it is not the start of the title itself.
+_ITEM_HEADING_RE = re.compile(r"item\s+(\d{1,2})(?:([a-c])\b|(?!\d))[\s.:\-\u2013\u2014]*", re.IGNORECASE)
 
-                end_match = re.search(end_pattern, text[start:], re.IGNORECASE)
-                end = start + end_match.start() if end_match else len(text)
+def find_10k_items(text):
+    """
+    Locate every 10-K Item in a single pass over the text.
+    Returns a list of {"item", "name", "start", "end"} dicts ordered by position.
+    """
+    occurrences = {number: [] for number in _ITEM_ORDER}
+    starts = {}
 
-                section_text = text[start:end].strip()
-                sections[name] = section_text
-                logger.info(f"Extracted section '{name}' with {len(section_text)} characters")
-            except Exception as e:
-                logger.error(f"Error extracting section '{name}': {e}")
-                continue
+    for match in _ITEM_HEADING_RE.finditer(text):
+        number = match.group(1).lstrip("0") + (match.group(2) or "").lower()
+        if number not in occurrences:
+            continue
+        occurrences[number].append(match.start())
+        for name, title_re in _ITEM_TITLES[number]:
+            if title_re.match(text, match.end()):
+                # Keep the *last* titled heading (skips TOC, grabs real section body)
+                starts[number] = (match.start(), name)
+                break
 
-        logger.info(f"Successfully extracted {len(sections)} sections")
-        return sections
+    items = []
+    for number, _, _ in TEN_K_ITEMS:
+        if number not in starts:
+            continue
+        start, name = starts[number]
+        end = len(text)
+        # End at the first following heading of the next Item present after this one
+        for next_number, _, _ in TEN_K_ITEMS[_ITEM_ORDER[number] + 1:]:
+            positions = occurrences[next_number]
+            i = bisect.bisect_right(positions, start)
+            if i < len(positions):
+                end = positions[i]
+                break
+        items.append({"item": number.upper(), "name": name, "start": start, "end": end})
+
+    items.sort(key=lambda item: item["start"])
+    return items
+
+@timed_stage("extract_sections")
+def extract_section_spans(text):
+    """
+    Locate 10-K sections in the text.
+    Returns a dictionary mapping section names to (start, end) character offsets.
+    """
+    try:
+        logger.info("Extracting sections from 10-K text")
+        return {item["name"]: (item["start"], item["end"]) for item in find_10k_items(text)}
     except Exception as e:
-        logger.error(f"Unexpected error in extract_sections: {e}")
+        logger.error(f"Unexpected error in extract_section_spans: {e}")
         return {}
 
-def analyze_with_gemini(section_name, section_text):
-    """Send section text to Gemini for summarization."""
+def extract_sections(text):
+    """
+    Extract the Item sections from a 10-K filing.
+    Returns a dictionary with section names and full text.
+    """
+    sections = {}
+    for name, (start, end) in extract_section_spans(text).items():
+        section_text = text[start:end].strip()
+        sections[name] = section_text
+        logger.info(f"Extracted section '{name}' with {len(section_text)} characters")
+
+    logger.info(f"Successfully extracted {len(sections)} sections")
+    return sections
+
+# Parsed sections persisted per filing so fetch, parse and regex run once per accession
+SECTION_CACHE_DIR = os.getenv("SECTION_CACHE_DIR", os.path.join(".cache", "sections"))
+# Bump when the extractor changes so filings are re-parsed with the new logic
+SECTION_CACHE_VERSION = 4
+
+def section_cache_path(url):
+    parsed = parse_filing_url(url)
+    if not parsed:
+        return None
+    cik, accession = parsed
+    return os.path.join(SECTION_CACHE_DIR, f"{cik}-{accession}-v{SECTION_CACHE_VERSION}.json.gz")
+
+# Cache entries list each section as paragraph hashes; the paragraph text itself lives
+# once in the paragraph store, however many filings repeat it.
+def load_cached_sections(url):
+    """Return the cached {name: {"start", "end", "text"}} mapping for a filing, or None on a miss."""
+    path = section_cache_path(url)
+    if not path:
+        return None
     try:
-        logger.info(f"Analyzing section '{section_name}' with Gemini AI")
-        prompt = f"""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            sections = json.load(f)["sections"]
+        try:
+            # Bump mtime so the age purge only removes entries that are no longer read
+            os.utime(path)
+        except OSError:
+            pass
+        paragraphs = load_paragraphs({h for entry in sections.values() for h in entry["paragraphs"]})
+        if paragraphs is None:
+            return None
+        return {
+            name: {"start": entry["start"], "end": entry["end"],
+                   "text": "\n\n".join(paragraphs[h] for h in entry["paragraphs"])}
+            for name, entry in sections.items()
+        }
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        logger.warning(f"Discarding unreadable section cache entry {path}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def store_cached_sections(url, sections):
+    """Cache {name: {"start", "end", "paragraphs"}} for a filing, adding new paragraphs to the paragraph store."""
+    path = section_cache_path(url)
+    if not path:
+        return
+    hashes = store_paragraphs([p for entry in sections.values() for p in entry["paragraphs"]])
+    if hashes is None:
+        return
+    entries = {}
+    for name, entry in sections.items():
+        entries[name] = {"start": entry["start"], "end": entry["end"],
+                         "paragraphs": hashes[:len(entry["paragraphs"])]}
+        hashes = hashes[len(entry["paragraphs"]):]
+    try:
+        os.makedirs(SECTION_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"url": url, "sections": entries}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write section cache entry for {url}: {e}")
+
+def get_10k_sections(url, fetch_text=None):
+    """
+    Return {section name: text} for a 10-K, using the section cache when possible.
+    Returns None if the filing could not be fetched. fetch_text(url) reads the filing
+    text on a section cache miss, fetch_10k_text by default.
+    """
+    return singleflight(("sections", url), lambda: _load_10k_sections(url, fetch_text or fetch_10k_text))
+
+def _load_10k_sections(url, fetch_text):
+    cached = load_cached_sections(url)
+    record_cache_result("sections", cached is not None)
+    if cached is not None:
+        logger.info(f"Section cache hit for {url}")
+        return {name: entry["text"] for name, entry in cached.items()}
+
+    text = fetch_text(url)
+    if not text:
+        return None
+
+    spans = extract_section_spans(text)
+    sections = {}
+    for name, (start, end) in spans.items():
+        # Sections are served as normalized paragraphs so fresh and cached text are identical
+        sections[name] = {"start": start, "end": end, "paragraphs": section_paragraphs(text[start:end])}
+        logger.info(f"Extracted section '{name}' with {len(sections[name]['paragraphs'])} paragraphs")
+
+    if sections:
+        store_cached_sections(url, sections)
+    return {name: "\n\n".join(entry["paragraphs"]) for name, entry in sections.items()}
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+BUFFETT_SYSTEM_INSTRUCTION = "You are Warren Buffett. " \
+    "Summarize financial documents clearly and concisely. " \
+    "Using tenets from the document 'The Warren Buffett Way' by Robert Hagstrom in your analysis."
+
+SUMMARY_PROMPT_TEMPLATE = """
         You are Warren Buffett.
         Summarize financial documents clearly and concisely.
         Using tenets from the document 'The Warren Buffett Way' by Robert Hagstrom in your analysis.
@@ -166,101 +1198,2201 @@ def analyze_with_gemini(section_name, section_text):
 
         Task: Summarize the key points in plain English.
         """
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction="You are Warren Buffett. " \
-                "Summarize financial documents clearly and concisely. " \
-                "Using tenets from the document 'The Warren Buffett Way' by Robert Hagstrom in your analysis."),
-            contents=prompt
-        )
-        logger.info(f"Successfully generated summary for section '{section_name}'")
-        return response.text
-    except Exception as e:
-        logger.error(f"Failed to analyze section '{section_name}' with Gemini: {e}")
-        return f"Error: Unable to generate summary for {section_name}. {str(e)}"
 
-@app.route("/")
-def home():
-    return render_template("index.html")
+# Sections larger than SUMMARY_CHUNK_TOKENS are summarized map-reduce style:
+# chunks are summarized concurrently, then the partial summaries are combined.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "30000"))
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
 
-@app.route("/analyze/10k/<ticker>/<section>")
-def analyze_10k(ticker, section):
-    try:
-        logger.info(f"Starting analysis for ticker: {ticker}, section: {section}")
+# Chunk prompts do not mention the chunk's position so their summaries can be reused
+# wherever the same text appears again, e.g. in next year's filing.
+CHUNK_PROMPT_TEMPLATE = """
+        Section: {section_name} (excerpt)
+        Text:
+        {section_text}
 
-        # Step 1: Get CIK
-        cik = get_cik(ticker)
-        if not cik:
-            logger.warning(f"CIK lookup failed for ticker: {ticker}")
-            return jsonify({"error": "Ticker not found"}), 404
+        Task: Summarize the key facts, figures and risks in this excerpt in plain English.
+        Keep it brief; it will be combined with summaries of the other parts of the section.
+        """
 
-        # Step 2: Get latest 10-K URL
-        url = get_latest_10k_url(cik)
-        if not url:
-            logger.warning(f"No 10-K found for CIK: {cik}")
-            return jsonify({"error": "No 10-K found"}), 404
+REDUCE_PROMPT_TEMPLATE = """
+        You are Warren Buffett.
+        Summarize financial documents clearly and concisely.
+        Using tenets from the document 'The Warren Buffett Way' by Robert Hagstrom in your analysis.
 
-        # Step 3: Fetch 10-K text
-        text = fetch_10k_text(url)
-        if not text:
-            logger.error(f"Failed to fetch 10-K text from URL: {url}")
-            return jsonify({"error": "Failed to fetch 10-K content"}), 500
+        Section: {section_name}
+        The section was too long to read at once, so it was summarized in parts.
+        Summaries of each part:
+        {partial_summaries}
 
-        # Step 4: Extract sections
-        sections = extract_sections(text)
-        if not sections:
-            logger.warning("No sections extracted from 10-K")
-            return jsonify({"error": "No sections found in 10-K"}), 404
+        Task: Combine these into one summary of the key points in plain English.
+        """
 
-        # Step 5: Find requested section
-        normalized_sections = {k.lower(): v for k, v in sections.items()}
-        section_key = section.lower()
+# Explicit Gemini context caching: the filing's sections and the system instruction are
+# uploaded once per accession and referenced by each section summary of that filing.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+GEMINI_CONTEXT_CACHE_MAX_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MAX_TOKENS", "800000"))
+# Gemini rejects explicit caches below a model-specific minimum size
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = 4096
 
-        if section_key not in normalized_sections:
-            logger.warning(f"Requested section '{section}' not found. Available: {list(sections.keys())}")
-            return jsonify({"error": f"Section {section} not found"}), 404
+CACHED_SECTION_PROMPT_TEMPLATE = """
+        The 10-K filing you were given is divided into sections marked "=== <section name> ===".
 
-        # Step 6: Analyze with Gemini
-        summary = analyze_with_gemini(section, normalized_sections[section_key])
-        if not summary or summary.startswith("Error:"):
-            logger.error(f"Gemini analysis failed for section: {section}")
-            return jsonify({"error": "Failed to generate summary"}), 500
+        Section: {section_name}
 
-        logger.info(f"Successfully completed analysis for {ticker} - {section}")
+        Task: Summarize the key points of this section in plain English.
+        """
 
-        # Generate TTS audio from summary using Gemini
-        try:
-            tts_response = client.models.generate_content(
-                model="gemini-2.5-flash-preview-tts",
-                contents=f"Read this summary: {summary}",
-                config=types.GenerateContentConfig(
-                    response_modalities=["AUDIO"],
-                    speech_config=types.SpeechConfig(
-                        voice_config=types.VoiceConfig(
-                            prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                                voice_name='Kore',
-                            )
-                        )
-                    ),
-                )
-            )
+def _prompt_version(*parts):
+    """Hash prompt templates so cached summaries are invalidated when the wording changes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
 
-            data = tts_response.candidates[0].content.parts[0].inline_data.data
+SUMMARY_PROMPT_VERSION = _prompt_version(
+    BUFFETT_SYSTEM_INSTRUCTION, SUMMARY_PROMPT_TEMPLATE,
+    CHUNK_PROMPT_TEMPLATE, REDUCE_PROMPT_TEMPLATE, str(SUMMARY_CHUNK_TOKENS))
+# Summaries written against the whole filing in a context cache read differently from ones
+# written from the section text alone, so the two modes are cached separately
+CONTEXT_CACHE_SUMMARY_PROMPT_VERSION = _prompt_version(SUMMARY_PROMPT_VERSION, CACHED_SECTION_PROMPT_TEMPLATE)
 
-            # Encode audio data to base64 for JSON response
-            audio_base64 = base64.b64encode(data).decode('utf-8')
+# Optionally hand Gemini exact figures computed from XBRL data (see /financials) with the
+# sections that discuss the numbers, instead of relying on it to read them from tables
+SUMMARY_INCLUDE_FINANCIALS = os.getenv("SUMMARY_INCLUDE_FINANCIALS", "false").lower() in ("1", "true", "yes")
+# Section names as produced by find_10k_items; Selected Financial Data only exists in older 10-Ks
+FINANCIALS_PROMPT_SECTIONS = ("management's discussion and analysis", "financial statements", "selected financial data")
+FINANCIALS_PROMPT_YEARS = 5
 
-            # Return JSON with summary and audio data
-            return jsonify({"ticker": ticker, "section": section, "summary": summary, "audio_data": audio_base64, "audio_mime": "audio/wav"})
-        except Exception as e:
-            logger.warning(f"TTS generation failed: {e}. Returning summary without audio.")
-            # Return JSON with summary only if TTS fails
-            return jsonify({"ticker": ticker, "section": section, "summary": summary})
+FINANCIALS_PROMPT_TEMPLATE = """
+        Key figures computed from the company's XBRL financial data (exact; prefer them to figures in the text):
+        {financials}
+        """
 
-    except Exception as e:
-        logger.error(f"Unexpected error in analyze_10k for {ticker}/{section}: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+FINANCIALS_PROMPT_VERSION = _prompt_version(FINANCIALS_PROMPT_TEMPLATE, str(FINANCIALS_PROMPT_YEARS))
+
+CHUNK_PROMPT_VERSION = _prompt_version(BUFFETT_SYSTEM_INSTRUCTION, CHUNK_PROMPT_TEMPLATE)
+
+# Local SQLite store for summaries and other small structured caches
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(".cache", "buffett.sqlite3"))
+
+_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    accession TEXT NOT NULL,
+    section TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (accession, section, prompt_version, model)
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    ticker TEXT NOT NULL,
+    section TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    message TEXT,
+    summary TEXT,
+    result TEXT,
+    error TEXT,
+    http_status INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    year INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_by_request ON jobs (ticker, section, status);
+
+CREATE TABLE IF NOT EXISTS context_caches (
+    accession TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (accession, model, prompt_version)
+);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    cik TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS filings (
+    cik TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    form TEXT NOT NULL,
+    filing_date TEXT,
+    report_date TEXT,
+    primary_document TEXT,
+    PRIMARY KEY (cik, accession)
+);
+CREATE INDEX IF NOT EXISTS filings_by_form ON filings (cik, form, filing_date);
+
+CREATE TABLE IF NOT EXISTS submission_pages (
+    cik TEXT NOT NULL,
+    name TEXT NOT NULL,
+    filing_from TEXT,
+    filing_to TEXT,
+    loaded_at REAL,
+    PRIMARY KEY (cik, name)
+);
+
+CREATE TABLE IF NOT EXISTS tickers (
+    ticker TEXT PRIMARY KEY,
+    cik TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS paragraphs (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    hash TEXT NOT NULL,
+    section TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (hash, section, prompt_version, model)
+);
+"""
+
+# Columns added to existing tables; each fails harmlessly once it has been applied
+_DB_MIGRATIONS = (
+    "ALTER TABLE jobs ADD COLUMN year INTEGER",
+)
+
+_db_initialized = set()
+_db_init_lock = threading.Lock()
+
+def db_connect():
+    """Open a connection to the local cache database, creating the schema on first use."""
+    directory = os.path.dirname(CACHE_DB_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30)
+    if CACHE_DB_PATH not in _db_initialized:
+        with _db_init_lock:
+            if CACHE_DB_PATH not in _db_initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_DB_SCHEMA)
+                for statement in _DB_MIGRATIONS:
+                    try:
+                        conn.execute(statement)
+                    except sqlite3.OperationalError:
+                        pass
+                _db_initialized.add(CACHE_DB_PATH)
+    return conn
+
+def summary_cache_key(section_name, section_text, accession):
+    # Only filings (those with an accession) are summarized through the context cache
+    version = CONTEXT_CACHE_SUMMARY_PROMPT_VERSION if GEMINI_CONTEXT_CACHE and accession else SUMMARY_PROMPT_VERSION
+    # Without an accession (e.g. ad-hoc text) fall back to hashing the content itself
+    if not accession:
+        accession = "sha256:" + hashlib.sha256(section_text.encode("utf-8")).hexdigest()
+    section = section_name.strip().lower()
+    if SUMMARY_INCLUDE_FINANCIALS and section in FINANCIALS_PROMPT_SECTIONS:
+        version = _prompt_version(version, FINANCIALS_PROMPT_VERSION)
+    return accession, section, version, GEMINI_MODEL
+
+def load_cached_summary(key):
+    try:
+        conn = db_connect()
+        try:
+            row = conn.execute(
+                "SELECT summary FROM summaries WHERE accession = ? AND section = ? "
+                "AND prompt_version = ? AND model = ?", key).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.warning(f"Summary cache lookup failed: {e}")
+        return None
+
+def store_cached_summary(key, summary):
+    try:
+        conn = db_connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO summaries "
+                    "(accession, section, prompt_version, model, summary, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (*key, summary, time.time()))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to store summary in cache: {e}")
+
+# Paragraph store: section text is kept as normalized paragraphs keyed by content hash, so
+# boilerplate repeated across years and companies is stored once.
+_PARAGRAPH_LOOKUP_BATCH = 500
+
+def normalize_whitespace(paragraph):
+    return " ".join(paragraph.split())
+
+def paragraph_hash(paragraph):
+    return hashlib.sha256(paragraph.encode("utf-8")).hexdigest()
+
+def section_paragraphs(text):
+    """Split section text into whitespace-normalized paragraphs."""
+    return [normalize_whitespace(p) for p in split_paragraphs(text)]
+
+def store_paragraphs(paragraphs):
+    """Add paragraphs to the paragraph store and return their hashes in order, or None on failure."""
+    hashes = [paragraph_hash(p) for p in paragraphs]
+    try:
+        conn = db_connect()
+        try:
+            with conn:
+                before = conn.total_changes
+                conn.executemany("INSERT OR IGNORE INTO paragraphs (hash, text) VALUES (?, ?)",
+                                 zip(hashes, paragraphs))
+                added = conn.total_changes - before
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to store paragraphs: {e}")
+        return None
+    logger.info(f"Paragraph store: {added} new of {len(hashes)} paragraphs")
+    return hashes
+
+def load_paragraphs(hashes):
+    """Return {hash: text} for the given hashes, or None if any is missing from the store."""
+    hashes = list(hashes)
+    found = {}
+    try:
+        conn = db_connect()
+        try:
+            for i in range(0, len(hashes), _PARAGRAPH_LOOKUP_BATCH):
+                batch = hashes[i:i + _PARAGRAPH_LOOKUP_BATCH]
+                found.update(conn.execute(
+                    f"SELECT hash, text FROM paragraphs WHERE hash IN ({','.join('?' * len(batch))})",
+                    batch).fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Paragraph store lookup failed: {e}")
+        return None
+    if len(found) < len(hashes):
+        logger.warning(f"Paragraph store is missing {len(hashes) - len(found)} paragraphs")
+        return None
+    return found
+
+def chunk_summary_key(section_name, chunk):
+    return paragraph_hash(chunk), section_name.strip().lower(), CHUNK_PROMPT_VERSION, GEMINI_MODEL
+
+def load_chunk_summaries(keys):
+    """Return {key: summary} for the chunk summaries already generated for any filing."""
+    found = {}
+    try:
+        conn = db_connect()
+        try:
+            for key in set(keys):
+                row = conn.execute(
+                    "SELECT summary FROM chunk_summaries WHERE hash = ? AND section = ? "
+                    "AND prompt_version = ? AND model = ?", key).fetchone()
+                if row:
+                    found[key] = row[0]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Chunk summary cache lookup failed: {e}")
+    for key in keys:
+        record_cache_result("chunk_summaries", key in found)
+    return found
+
+def store_chunk_summary(key, summary):
+    try:
+        conn = db_connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO chunk_summaries "
+                    "(hash, section, prompt_version, model, summary, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", (*key, summary, time.time()))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to store chunk summary in cache: {e}")
+
+# The section cache, paragraph store and chunk summaries are purged alongside the filing
+# cache: section cache entries unused for SECTION_CACHE_MAX_AGE_DAYS (or written by an older
+# extractor) are removed, then every paragraph no remaining entry refers to, and chunk
+# summaries older than CHUNK_SUMMARY_MAX_AGE_DAYS. 0 disables an age limit.
+SECTION_CACHE_MAX_AGE_DAYS = float(os.getenv("SECTION_CACHE_MAX_AGE_DAYS", "180"))
+CHUNK_SUMMARY_MAX_AGE_DAYS = float(os.getenv("CHUNK_SUMMARY_MAX_AGE_DAYS", "90"))
+# Purging reads every section cache entry, so it runs at most this often per process
+STORE_PURGE_INTERVAL_SECONDS = 3600
+
+_store_purge_lock = threading.Lock()
+_store_purged_at = 0.0
+
+def _referenced_paragraphs():
+    """Remove stale section cache entries and return the paragraph hashes the rest refer to."""
+    suffix = f"-v{SECTION_CACHE_VERSION}.json.gz"
+    cutoff = time.time() - SECTION_CACHE_MAX_AGE_DAYS * 86400 if SECTION_CACHE_MAX_AGE_DAYS > 0 else None
+    hashes = set()
+    with os.scandir(SECTION_CACHE_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith(".json.gz"):
+                continue
+            try:
+                if not entry.name.endswith(suffix) or (cutoff and entry.stat().st_mtime < cutoff):
+                    os.remove(entry.path)
+                    logger.info(f"Removed {entry.path} from section cache")
+                    continue
+                with gzip.open(entry.path, "rt", encoding="utf-8") as f:
+                    sections = json.load(f)["sections"]
+            except FileNotFoundError:
+                continue
+            except (OSError, EOFError, ValueError, KeyError) as e:
+                # Left for load_cached_sections to discard; its paragraphs are re-stored on re-parse
+                logger.warning(f"Skipping unreadable section cache entry {entry.path}: {e}")
+                continue
+            for section in sections.values():
+                hashes.update(section["paragraphs"])
+    return hashes
+
+def purge_summary_stores(force=False):
+    """
+    Purge the section cache, paragraph store and chunk summaries (see above), at most once
+    per STORE_PURGE_INTERVAL_SECONDS unless force is set. Returns the counts removed, or None
+    if the purge was skipped or failed.
+    """
+    global _store_purged_at
+    if not _store_purge_lock.acquire(blocking=False):
+        return None
+    try:
+        if not force and time.time() - _store_purged_at < STORE_PURGE_INTERVAL_SECONDS:
+            return None
+        _store_purged_at = time.time()
+        try:
+            referenced = _referenced_paragraphs()
+        except FileNotFoundError:
+            referenced = set()
+        except OSError as e:
+            logger.warning(f"Failed to scan section cache: {e}")
+            return None
+
+        counts = {"paragraphs": 0, "chunk_summaries": 0}
+        conn = db_connect()
+        try:
+            with conn:
+                # A filing parsed while the scan ran may lose paragraphs it just stored; its
+                # entry then misses in load_cached_sections and is re-parsed and re-stored
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS referenced_paragraphs (hash TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM referenced_paragraphs")
+                conn.executemany("INSERT OR IGNORE INTO referenced_paragraphs (hash) VALUES (?)",
+                                 ((h,) for h in referenced))
+                counts["paragraphs"] = conn.execute(
+                    "DELETE FROM paragraphs WHERE hash NOT IN (SELECT hash FROM referenced_paragraphs)").rowcount
+                if CHUNK_SUMMARY_MAX_AGE_DAYS > 0:
+                    counts["chunk_summaries"] = conn.execute(
+                        "DELETE FROM chunk_summaries WHERE created_at < ?",
+                        (time.time() - CHUNK_SUMMARY_MAX_AGE_DAYS * 86400,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to purge summary stores: {e}")
+            return None
+        finally:
+            conn.close()
+        logger.info(f"Purged {counts['paragraphs']} paragraphs and {counts['chunk_summaries']} chunk summaries")
+        return counts
+    finally:
+        _store_purge_lock.release()
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return len(text) // 4
+
+_HEADING_RE = re.compile(r"^(item\s+\d+[a-z]?\b|[A-Z][A-Z0-9 ,&'\-]{3,80}$)", re.IGNORECASE)
+
+def split_paragraphs(text):
+    """Split section text into paragraphs on blank lines, falling back to single lines."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text)]
+    paragraphs = [p for p in paragraphs if p]
+    if len(paragraphs) <= 1:
+        paragraphs = [line.strip() for line in text.splitlines() if line.strip()]
+    return paragraphs
+
+def _split_oversized(paragraph, max_chars):
+    """Split a paragraph longer than max_chars on line, then sentence, then hard boundaries."""
+    pieces = []
+    for unit in paragraph.splitlines() if "\n" in paragraph else [paragraph]:
+        while len(unit) > max_chars:
+            cut = unit.rfind(". ", 0, max_chars)
+            cut = cut + 1 if cut > max_chars // 2 else max_chars
+            pieces.append(unit[:cut].strip())
+            unit = unit[cut:]
+        if unit.strip():
+            pieces.append(unit.strip())
+    return pieces
+
+# Once a chunk is half full it also ends before any paragraph whose hash has these bits
+# clear. Cut points then depend on content rather than offsets, so an edit in one part of a
+# section leaves the other chunks (and their cached summaries) unchanged.
+_CHUNK_BOUNDARY_MASK = 0x7
+
+def _is_chunk_boundary(paragraph):
+    return int(paragraph_hash(paragraph)[:8], 16) & _CHUNK_BOUNDARY_MASK == 0
+
+def chunk_section_text(text, max_tokens=None):
+    """
+    Split text into chunks of at most max_tokens (estimated), breaking on paragraph boundaries
+    and preferring to start a new chunk at a heading or content-defined boundary once the
+    current chunk is half full.
+    """
+    max_tokens = max_tokens or SUMMARY_CHUNK_TOKENS
+    max_chars = max_tokens * 4
+    chunks = []
+    current = []
+    current_len = 0
+
+    for paragraph in split_paragraphs(text):
+        units = [paragraph] if len(paragraph) <= max_chars else _split_oversized(paragraph, max_chars)
+        for unit in units:
+            is_heading = len(unit) < 120 and bool(_HEADING_RE.match(unit))
+            if current and (current_len + len(unit) + 2 > max_chars
+                            or (current_len > max_chars // 2
+                                and (is_heading or _is_chunk_boundary(unit)))):
+                chunks.append("\n\n".join(current))
+                current = []
+                current_len = 0
+            current.append(unit)
+            current_len += len(unit) + 2
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def summary_config(cached_content=None):
+    if cached_content:
+        # The system instruction is part of the cached content
+        return types.GenerateContentConfig(cached_content=cached_content)
+    return types.GenerateContentConfig(system_instruction=BUFFETT_SYSTEM_INSTRUCTION)
+
+def _generate_summary(prompt, config=None):
+    response = client.models.generate_content(
+        model=GEMINI_MODEL,
+        config=config or summary_config(),
+        contents=prompt
+    )
+    record_gemini_usage(response, GEMINI_MODEL)
+    return response.text
+
+def _summarize_chunks(section_name, chunks):
+    """
+    Map step: summarize chunks concurrently, returning partial summaries in order.
+    Chunks already summarized for any filing are taken from the chunk summary cache.
+    """
+    keys = [chunk_summary_key(section_name, chunk) for chunk in chunks]
+    summaries = load_chunk_summaries(keys)
+    missing = {key: chunk for key, chunk in zip(keys, chunks) if key not in summaries}
+    logger.info(f"Summarizing section '{section_name}' in {len(chunks)} chunks, {len(missing)} not cached")
+
+    def summarize(item):
+        key, chunk = item
+        summary = _generate_summary(CHUNK_PROMPT_TEMPLATE.format(section_name=section_name, section_text=chunk))
+        store_chunk_summary(key, summary)
+        return key, summary
+
+    with ThreadPoolExecutor(max_workers=max(1, SUMMARY_MAX_WORKERS)) as executor:
+        summaries.update(executor.map(summarize, missing.items()))
+    return [summaries[key] for key in keys]
+
+def build_summary_prompt(section_name, section_text, accession=None):
+    """
+    Return the final summary prompt for a section. Oversized sections are first reduced
+    to per-chunk summaries so the final prompt stays small.
+    """
+    if estimate_tokens(section_text) <= SUMMARY_CHUNK_TOKENS:
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(section_name=section_name, section_text=section_text)
+        return with_financials(prompt, section_name, accession)
+
+    chunks = chunk_section_text(section_text)
+    partial_summaries = _summarize_chunks(section_name, chunks)
+    combined = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries))
+    prompt = REDUCE_PROMPT_TEMPLATE.format(section_name=section_name, partial_summaries=combined)
+    return with_financials(prompt, section_name, accession)
+
+def with_financials(prompt, section_name, accession):
+    """Append the filer's XBRL key figures to a summary prompt if SUMMARY_INCLUDE_FINANCIALS applies."""
+    if (not SUMMARY_INCLUDE_FINANCIALS or not accession
+            or section_name.strip().lower() not in FINANCIALS_PROMPT_SECTIONS):
+        return prompt
+    financials = filing_financials_context(accession)
+    if not financials:
+        return prompt
+    return prompt + FINANCIALS_PROMPT_TEMPLATE.format(financials=financials)
+
+def _filing_context(filing_sections):
+    return "\n\n".join(f"=== {name} ===\n{text}" for name, text in filing_sections.items())
+
+def _create_context_cache(accession, filing_sections):
+    conn = db_connect()
+    try:
+        row = conn.execute(
+            "SELECT name FROM context_caches WHERE accession = ? AND model = ? AND prompt_version = ? "
+            "AND expires_at > ?",
+            (accession, GEMINI_MODEL, CONTEXT_CACHE_SUMMARY_PROMPT_VERSION, time.time() + 60)).fetchone()
+    finally:
+        conn.close()
+    if row:
+        return row[0]
+
+    context = _filing_context(filing_sections)
+    tokens = estimate_tokens(context)
+    if not GEMINI_CONTEXT_CACHE_MIN_TOKENS <= tokens <= GEMINI_CONTEXT_CACHE_MAX_TOKENS:
+        logger.info(f"Not caching context for {accession}: ~{tokens} tokens is outside the cacheable range")
+        return None
+
+    logger.info(f"Creating Gemini context cache for {accession} (~{tokens} tokens)")
+    cache = client.caches.create(
+        model=GEMINI_MODEL,
+        config=types.CreateCachedContentConfig(
+            display_name=f"10-K {accession}",
+            system_instruction=BUFFETT_SYSTEM_INSTRUCTION,
+            contents=[types.Content(role="user", parts=[types.Part(text=context)])],
+            ttl=f"{GEMINI_CONTEXT_CACHE_TTL_SECONDS}s",
+        ),
+    )
+    conn = db_connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO context_caches (accession, model, prompt_version, name, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (accession, GEMINI_MODEL, CONTEXT_CACHE_SUMMARY_PROMPT_VERSION, cache.name,
+                 time.time() + GEMINI_CONTEXT_CACHE_TTL_SECONDS))
+    finally:
+        conn.close()
+    return cache.name
+
+def get_filing_context_cache(accession, filing_sections):
+    """Return the name of a Gemini cached content holding the whole filing, or None if unavailable."""
+    if not GEMINI_CONTEXT_CACHE or not accession or not filing_sections:
+        return None
+    try:
+        return singleflight(("context-cache", accession, GEMINI_MODEL),
+                            lambda: _create_context_cache(accession, filing_sections))
+    except Exception as e:
+        logger.warning(f"Gemini context caching unavailable for {accession}: {e}")
+        return None
+
+def invalidate_filing_context_cache(accession, name):
+    try:
+        conn = db_connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM context_caches WHERE accession = ? AND name = ?", (accession, name))
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to invalidate context cache {name}: {e}")
+
+def build_summary_request(section_name, section_text, accession=None, filing_sections=None):
+    """
+    Return (prompt, config, cache name) for the final summary call. When the filing is in a
+    Gemini context cache the prompt only names the section; otherwise it carries the text.
+    """
+    cache_name = get_filing_context_cache(accession, filing_sections)
+    if cache_name:
+        prompt = CACHED_SECTION_PROMPT_TEMPLATE.format(section_name=section_name)
+        return with_financials(prompt, section_name, accession), summary_config(cache_name), cache_name
+    return build_summary_prompt(section_name, section_text, accession), summary_config(), None
+
+@timed_stage("analyze_with_gemini")
+def analyze_with_gemini(section_name, section_text, accession=None, filing_sections=None):
+    """Send section text to Gemini for summarization, reusing cached summaries for the same filing."""
+    key = summary_cache_key(section_name, section_text, accession)
+    return singleflight(("summary",) + key,
+                        lambda: _analyze_with_gemini(section_name, section_text, key, accession, filing_sections))
+
+def _analyze_with_gemini(section_name, section_text, key, accession, filing_sections):
+    try:
+        cached = load_cached_summary(key)
+        record_cache_result("summaries", cached is not None)
+        if cached is not None:
+            logger.info(f"Summary cache hit for section '{section_name}' of {key[0]}")
+            return cached
+
+        logger.info(f"Analyzing section '{section_name}' with Gemini AI")
+        prompt, config, cache_name = build_summary_request(section_name, section_text, accession, filing_sections)
+        try:
+            summary = _generate_summary(prompt, config)
+        except Exception as e:
+            if not cache_name:
+                raise
+            # The cached content may have expired or been deleted; retry with the full text
+            logger.warning(f"Summary with context cache {cache_name} failed, retrying without it: {e}")
+            invalidate_filing_context_cache(accession, cache_name)
+            summary = _generate_summary(build_summary_prompt(section_name, section_text, accession))
+        logger.info(f"Successfully generated summary for section '{section_name}'")
+        if summary:
+            store_cached_summary(key, summary)
+        return summary
+    except Exception as e:
+        logger.error(f"Failed to analyze section '{section_name}' with Gemini: {e}")
+        return f"Error: Unable to generate summary for {section_name}. {str(e)}"
+
+def stream_analysis_with_gemini(section_name, section_text, accession=None, filing_sections=None):
+    """Like analyze_with_gemini, but yields the summary in chunks as Gemini generates it."""
+    with observe_stage("analyze_with_gemini"):
+        yield from _stream_analysis_with_gemini(section_name, section_text, accession, filing_sections)
+
+def _generate_summary_stream(prompt, config):
+    chunk = None
+    for chunk in client.models.generate_content_stream(model=GEMINI_MODEL, config=config, contents=prompt):
+        if chunk.text:
+            yield chunk.text
+    # Usage metadata is cumulative, so only the final chunk is counted
+    if chunk is not None:
+        record_gemini_usage(chunk, GEMINI_MODEL)
+
+def _stream_analysis_with_gemini(section_name, section_text, accession, filing_sections):
+    key = summary_cache_key(section_name, section_text, accession)
+    cached = load_cached_summary(key)
+    record_cache_result("summaries", cached is not None)
+    if cached is not None:
+        logger.info(f"Summary cache hit for section '{section_name}' of {key[0]}")
+        yield cached
+        return
+
+    logger.info(f"Streaming analysis of section '{section_name}' with Gemini AI")
+    prompt, config, cache_name = build_summary_request(section_name, section_text, accession, filing_sections)
+    chunks = []
+    try:
+        for text in _generate_summary_stream(prompt, config):
+            chunks.append(text)
+            yield text
+    except Exception as e:
+        if not cache_name or chunks:
+            raise
+        logger.warning(f"Summary with context cache {cache_name} failed, retrying without it: {e}")
+        invalidate_filing_context_cache(accession, cache_name)
+        for text in _generate_summary_stream(build_summary_prompt(section_name, section_text, accession),
+                                             summary_config()):
+            chunks.append(text)
+            yield text
+
+    summary = "".join(chunks)
+    logger.info(f"Successfully streamed summary for section '{section_name}'")
+    if summary:
+        store_cached_summary(key, summary)
+
+# Year-over-year change summaries: paragraphs of this year's section are aligned with last
+# year's, and only new or revised paragraphs are sent to Gemini
+CHANGE_SIMILARITY_THRESHOLD = float(os.getenv("CHANGE_SIMILARITY_THRESHOLD", "0.5"))
+_SHINGLE_WORDS = 5
+
+CHANGES_PROMPT_TEMPLATE = """
+        You are Warren Buffett.
+        Summarize financial documents clearly and concisely.
+        Using tenets from the document 'The Warren Buffett Way' by Robert Hagstrom in your analysis.
+
+        Section: {section_name}
+        Compared with last year's 10-K, {unchanged} paragraphs are unchanged and {removed} were removed.
+        New and revised paragraphs (revised ones are followed by last year's wording):
+        {changes}
+
+        Task: Explain what is new or different this year and why it matters to a long-term owner.
+        Ignore changes that are only rewording or updated dates and figures with no new substance.
+        """
+
+CHANGES_PROMPT_VERSION = _prompt_version(
+    BUFFETT_SYSTEM_INSTRUCTION, CHANGES_PROMPT_TEMPLATE, CHUNK_PROMPT_TEMPLATE,
+    str(SUMMARY_CHUNK_TOKENS), str(CHANGE_SIMILARITY_THRESHOLD), str(_SHINGLE_WORDS))
+
+def normalize_paragraph(paragraph):
+    """Lower-case and collapse whitespace so formatting differences do not count as changes."""
+    return " ".join(paragraph.lower().split())
+
+def _shingles(normalized):
+    words = normalized.split()
+    size = min(_SHINGLE_WORDS, len(words))
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+def diff_paragraphs(old_text, new_text):
+    """
+    Align the paragraphs of new_text with those of old_text, wherever they moved to.
+    Identical paragraphs (after normalization) are matched by hash; the rest are paired with
+    the most similar unmatched old paragraph by word-shingle Jaccard similarity.
+    Returns {"added": [new], "modified": [(old, new)], "removed": [old], "unchanged": count}.
+    """
+    old_paragraphs = split_paragraphs(old_text)
+    new_paragraphs = split_paragraphs(new_text)
+
+    old_by_text = {}
+    for i, paragraph in enumerate(old_paragraphs):
+        old_by_text.setdefault(normalize_paragraph(paragraph), []).append(i)
+
+    unchanged = 0
+    matched_old = set()
+    pending = []
+    for paragraph in new_paragraphs:
+        normalized = normalize_paragraph(paragraph)
+        candidates = old_by_text.get(normalized)
+        if candidates:
+            matched_old.add(candidates.pop())
+            unchanged += 1
+        else:
+            pending.append((paragraph, normalized))
+
+    # Inverted index from shingle to the unmatched old paragraphs containing it
+    old_shingles = {}
+    index = {}
+    for i, paragraph in enumerate(old_paragraphs):
+        if i not in matched_old:
+            old_shingles[i] = _shingles(normalize_paragraph(paragraph))
+            for shingle in old_shingles[i]:
+                index.setdefault(shingle, []).append(i)
+
+    added = []
+    modified = []
+    for paragraph, normalized in pending:
+        shingles = _shingles(normalized)
+        shared = {}
+        for shingle in shingles:
+            for i in index.get(shingle, ()):
+                if i not in matched_old:
+                    shared[i] = shared.get(i, 0) + 1
+        best, best_score = None, 0.0
+        for i, count in shared.items():
+            score = count / (len(shingles) + len(old_shingles[i]) - count)
+            if score > best_score:
+                best, best_score = i, score
+        if best is not None and best_score >= CHANGE_SIMILARITY_THRESHOLD:
+            matched_old.add(best)
+            modified.append((old_paragraphs[best], paragraph))
+        else:
+            added.append(paragraph)
+
+    removed = [p for i, p in enumerate(old_paragraphs) if i not in matched_old]
+    return {"added": added, "modified": modified, "removed": removed, "unchanged": unchanged}
+
+def format_changes(diff):
+    parts = [f"[NEW] {paragraph}" for paragraph in diff["added"]]
+    parts += [f"[REVISED] {new}\n[LAST YEAR] {old}" for old, new in diff["modified"]]
+    return "\n\n".join(parts)
+
+def build_changes_prompt(section_name, diff):
+    changes = format_changes(diff)
+    if estimate_tokens(changes) > SUMMARY_CHUNK_TOKENS:
+        partial_summaries = _summarize_chunks(f"{section_name} (changes since last year)",
+                                              chunk_section_text(changes))
+        changes = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries))
+    return CHANGES_PROMPT_TEMPLATE.format(section_name=section_name, changes=changes,
+                                          unchanged=diff["unchanged"], removed=len(diff["removed"]))
+
+def analyze_changes_with_gemini(section_name, diff, accession, prior_accession):
+    """Summarize what changed in a section since the prior filing, caching the result per pair of filings."""
+    key = (accession, f"{section_name.strip().lower()} changes since {prior_accession}",
+           CHANGES_PROMPT_VERSION, GEMINI_MODEL)
+    return singleflight(("summary",) + key, lambda: _analyze_changes_with_gemini(section_name, diff, key))
+
+def _analyze_changes_with_gemini(section_name, diff, key):
+    try:
+        cached = load_cached_summary(key)
+        record_cache_result("summaries", cached is not None)
+        if cached is not None:
+            logger.info(f"Summary cache hit for changes in section '{section_name}' of {key[0]}")
+            return cached
+
+        if not diff["added"] and not diff["modified"]:
+            summary = f"No new or revised paragraphs in {section_name} compared with last year's 10-K."
+        else:
+            logger.info(f"Analyzing {len(diff['added'])} new and {len(diff['modified'])} revised paragraphs "
+                        f"of section '{section_name}' with Gemini AI")
+            summary = _generate_summary(build_changes_prompt(section_name, diff))
+        if summary:
+            store_cached_summary(key, summary)
+        return summary
+    except Exception as e:
+        logger.error(f"Failed to analyze changes in section '{section_name}' with Gemini: {e}")
+        return f"Error: Unable to generate summary of changes for {section_name}. {str(e)}"
+
+# Text-to-speech audio cached on disk, keyed by a hash of the summary text and voice
+TTS_MODEL = os.getenv("TTS_MODEL", "gemini-2.5-flash-preview-tts")
+TTS_VOICE = os.getenv("TTS_VOICE", "Kore")
+TTS_SAMPLE_RATE = 24000
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(".cache", "audio"))
+
+_audio_locks = {}
+_audio_locks_lock = threading.Lock()
+AUDIO_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+def audio_id_for(summary, voice=TTS_VOICE):
+    return hashlib.sha256(f"{TTS_MODEL}\0{voice}\0{summary}".encode("utf-8")).hexdigest()[:32]
+
+def audio_url(audio_id):
+    return f"/audio/{audio_id}"
+
+def register_audio(summary, voice=TTS_VOICE):
+    """Record the text to synthesize for an audio id and return the id, or None on failure."""
+    audio_id = audio_id_for(summary, voice)
+    path = os.path.join(AUDIO_CACHE_DIR, f"{audio_id}.json")
+    if os.path.exists(path):
+        return audio_id
+    try:
+        os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "voice": voice}, f)
+        os.replace(tmp_path, path)
+        return audio_id
+    except OSError as e:
+        logger.warning(f"Failed to register audio for summary: {e}")
+        return None
+
+@timed_stage("tts")
+def synthesize_speech(text, voice=TTS_VOICE):
+    """Generate speech for text with Gemini TTS and return it as WAV bytes."""
+    tts_response = client.models.generate_content(
+        model=TTS_MODEL,
+        contents=f"Read this summary: {text}",
+        config=types.GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=types.SpeechConfig(
+                voice_config=types.VoiceConfig(
+                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                        voice_name=voice,
+                    )
+                )
+            ),
+        )
+    )
+
+    record_gemini_usage(tts_response, TTS_MODEL)
+    data = tts_response.candidates[0].content.parts[0].inline_data.data
+    if data[:4] == b"RIFF":
+        return data
+
+    # Gemini returns raw 16-bit mono PCM; wrap it in a WAV container so browsers can play it
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(TTS_SAMPLE_RATE)
+        wav.writeframes(data)
+    return buffer.getvalue()
+
+def get_audio_path(audio_id):
+    """Return the path of the WAV file for audio_id, synthesizing it on first request."""
+    wav_path = os.path.join(AUDIO_CACHE_DIR, f"{audio_id}.wav")
+    if os.path.exists(wav_path):
+        record_cache_result("audio", True)
+        return wav_path
+
+    with _audio_locks_lock:
+        lock = _audio_locks.setdefault(audio_id, threading.Lock())
+    try:
+        with lock:
+            if os.path.exists(wav_path):
+                record_cache_result("audio", True)
+                return wav_path
+            try:
+                with open(os.path.join(AUDIO_CACHE_DIR, f"{audio_id}.json"), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                return None
+
+            record_cache_result("audio", False)
+            logger.info(f"Synthesizing audio {audio_id}")
+            audio = synthesize_speech(entry["summary"], entry["voice"])
+            tmp_path = f"{wav_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, wav_path)
+            return wav_path
+    finally:
+        with _audio_locks_lock:
+            _audio_locks.pop(audio_id, None)
+
+@app.route("/")
+def home():
+    return render_template("index.html")
+
+def render_metrics():
+    if PROMETHEUS_MULTIPROC_DIR:
+        # Aggregate the per-process files written by every worker
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+def cache_stats_snapshot():
+    with _cache_stats_lock:
+        stats = {name: dict(counts) for name, counts in _cache_stats.items()}
+    for counts in stats.values():
+        total = counts["hits"] + counts["misses"]
+        counts["hit_ratio"] = round(counts["hits"] / total, 4) if total else None
+    return stats
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(cache_stats_snapshot())
+
+@app.route("/audio/<audio_id>")
+def get_audio(audio_id):
+    if not AUDIO_ID_RE.match(audio_id):
+        return jsonify({"error": "Audio not found"}), 404
+    try:
+        path = get_audio_path(audio_id)
+    except Exception as e:
+        logger.warning(f"TTS generation failed for audio {audio_id}: {e}")
+        return jsonify({"error": "Failed to generate audio"}), 502
+    if not path:
+        return jsonify({"error": "Audio not found"}), 404
+
+    # Audio ids are content hashes, so the file never changes and can be cached indefinitely
+    response = send_file(path, mimetype="audio/wav", conditional=True, max_age=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+def resolve_10k(ticker, year=None):
+    """
+    Steps 1 and 2 of the pipeline: the latest 10-K, or the one for fiscal year year.
+    Returns (10-K URL, None) or (None, failure dict).
+    """
+    # Step 1: Get CIK
+    cik = get_cik(ticker)
+    if not cik:
+        logger.warning(f"CIK lookup failed for ticker: {ticker}")
+        return None, {"error": "Ticker not found", "status": 404}
+
+    # Step 2: Get the 10-K URL
+    if year is None:
+        url = get_latest_10k_url(cik)
+        if not url:
+            logger.warning(f"No 10-K found for CIK: {cik}")
+            return None, {"error": "No 10-K found", "status": 404}
+    else:
+        url = get_10k_url_for_year(cik, year)
+        if not url:
+            logger.warning(f"No {year} 10-K found for CIK: {cik}")
+            return None, {"error": f"No 10-K found for {year}", "status": 404}
+    return url, None
+
+def iter_analysis_events(ticker, section, stream_summary=True, url=None, year=None):
+    """
+    Run the analysis pipeline, yielding (event, data) tuples as each stage progresses.
+    Emits "progress" per stage, "summary" text chunks, then a final "done" or "failed" event.
+    Pass url to skip resolving the ticker when the 10-K is already known, or year to
+    analyze the 10-K for that fiscal year instead of the latest one.
+    """
+    label = metrics_section_label(section)
+    token = metrics_section.set(label)
+    ANALYSES_IN_PROGRESS.labels(label).inc()
+    try:
+        yield from _iter_analysis_events(ticker, section, stream_summary, url, year)
+    finally:
+        ANALYSES_IN_PROGRESS.labels(label).dec()
+        # A generator closed from another context cannot reset the token
+        with contextlib.suppress(ValueError):
+            metrics_section.reset(token)
+
+def _iter_analysis_events(ticker, section, stream_summary, url, year):
+    logger.info(f"Starting analysis for ticker: {ticker}, section: {section}")
+
+    if url is None:
+        which = "latest" if year is None else str(year)
+        yield "progress", {"stage": "filing", "message": f"Finding the {which} 10-K filing for {ticker}..."}
+        url, failure = resolve_10k(ticker, year)
+        if failure:
+            yield "failed", failure
+            return
+
+    # Step 3 & 4: Fetch 10-K text and extract sections (cached per accession)
+    yield "progress", {"stage": "sections", "message": "Reading the 10-K..."}
+    sections = get_10k_sections(url)
+    if sections is None:
+        logger.error(f"Failed to fetch 10-K text from URL: {url}")
+        yield "failed", {"error": "Failed to fetch 10-K content", "status": 500}
+        return
+
+    if not sections:
+        logger.warning("No sections extracted from 10-K")
+        yield "failed", {"error": "No sections found in 10-K", "status": 404}
+        return
+
+    # Step 5: Find requested section
+    section_text = find_section(sections, section)
+    if section_text is None:
+        logger.warning(f"Requested section '{section}' not found. Available: {list(sections.keys())}")
+        yield "failed", {"error": f"Section {section} not found", "status": 404}
+        return
+
+    # Step 6: Analyze with Gemini
+    yield "progress", {"stage": "summary", "message": "Summarizing like Warren Buffett..."}
+    filing = parse_filing_url(url)
+    accession = filing[1] if filing else None
+    if stream_summary:
+        chunks = []
+        try:
+            for chunk in stream_analysis_with_gemini(section, section_text,
+                                                     accession=accession, filing_sections=sections):
+                chunks.append(chunk)
+                yield "summary", {"text": chunk}
+        except Exception as e:
+            # A partial summary must never be reported (or voiced) as the result
+            logger.error(f"Failed to stream analysis of section '{section}' with Gemini: {e}")
+            yield "failed", {"error": "Failed to generate summary", "status": 500}
+            return
+        summary = "".join(chunks)
+    else:
+        summary = analyze_with_gemini(section, section_text, accession=accession, filing_sections=sections)
+    if not summary or summary.startswith("Error:"):
+        logger.error(f"Gemini analysis failed for section: {section}")
+        yield "failed", {"error": "Failed to generate summary", "status": 500}
+        return
+
+    logger.info(f"Successfully completed analysis for {ticker} - {section}")
+    yield "done", analysis_result(ticker, section, summary, year)
+
+def analysis_result(ticker, section, summary, year=None):
+    # Audio is synthesized lazily by /audio/<id> so the summary is returned immediately
+    result = {"ticker": ticker, "section": section, "summary": summary}
+    if year is not None:
+        result["year"] = year
+    audio_id = register_audio(summary)
+    if audio_id:
+        result["audio_url"] = audio_url(audio_id)
+        result["audio_mime"] = "audio/wav"
+    return result
+
+def run_analysis(ticker, section, url=None, year=None):
+    """Run the analysis pipeline to completion. Returns (JSON payload, HTTP status)."""
+    for event, data in iter_analysis_events(ticker, section, stream_summary=False, url=url, year=year):
+        if event == "failed":
+            return {"error": data["error"]}, data["status"]
+        if event == "done":
+            return data, 200
+    return {"error": "Internal server error"}, 500
+
+def run_analysis_once(ticker, section, year=None):
+    """run_analysis, coalescing concurrent requests for the same ticker, year and section."""
+    key = ("analysis", ticker.strip().upper(), year, section.strip().lower())
+    payload, status = singleflight(key, lambda: run_analysis(ticker, section, year=year))
+    if status == 200:
+        payload = dict(payload, ticker=ticker, section=section)
+    return payload, status
+
+@app.route("/analyze/10k/<ticker>/<section>")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>")
+def analyze_10k(ticker, section, year=None):
+    _, error = parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        payload, status = run_analysis_once(ticker, section, year)
+        return jsonify(payload), status
+
+    except Exception as e:
+        logger.error(f"Unexpected error in analyze_10k for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+def filing_fiscal_year(cik, accession):
+    """Fiscal year of an indexed filing, by the same rule as fiscal_year_10k_filing."""
+    conn = db_connect()
+    try:
+        row = conn.execute(
+            f"SELECT {_FISCAL_YEAR_SQL} FROM filings WHERE cik = ? AND accession = ?", (cik, accession)).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def find_section(sections, section):
+    """Text of the named section, matched case-insensitively, or None."""
+    return {k.lower(): v for k, v in sections.items()}.get(section.lower())
+
+def run_change_analysis(ticker, section, year=None):
+    """
+    Summarize what changed in a section since the prior year's 10-K.
+    Returns (JSON payload, HTTP status).
+    """
+    logger.info(f"Starting change analysis for ticker: {ticker}, section: {section}")
+    url, failure = resolve_10k(ticker, year)
+    if failure:
+        return {"error": failure["error"]}, failure["status"]
+
+    cik, accession = parse_filing_url(url)
+    fiscal_year = filing_fiscal_year(cik, accession)
+    prior_url = get_10k_url_for_year(cik, fiscal_year - 1) if fiscal_year else None
+    if not prior_url:
+        return {"error": "No prior year 10-K found"}, 404
+    prior_accession = parse_filing_url(prior_url)[1]
+
+    sections = get_10k_sections(url)
+    prior_sections = get_10k_sections(prior_url)
+    if sections is None or prior_sections is None:
+        return {"error": "Failed to fetch 10-K content"}, 500
+
+    section_text = find_section(sections, section)
+    if section_text is None:
+        logger.warning(f"Requested section '{section}' not found. Available: {list(sections.keys())}")
+        return {"error": f"Section {section} not found"}, 404
+    prior_text = find_section(prior_sections, section)
+    if prior_text is None:
+        return {"error": f"Section {section} not found in the {fiscal_year - 1} 10-K"}, 404
+
+    diff = diff_paragraphs(prior_text, section_text)
+    summary = analyze_changes_with_gemini(section, diff, accession, prior_accession)
+    if not summary or summary.startswith("Error:"):
+        logger.error(f"Gemini change analysis failed for section: {section}")
+        return {"error": "Failed to generate summary"}, 500
+
+    logger.info(f"Successfully completed change analysis for {ticker} - {section}")
+    result = analysis_result(ticker, section, summary, year)
+    result.update({
+        "fiscal_year": fiscal_year,
+        "prior_fiscal_year": fiscal_year - 1,
+        "changes": {
+            "added": len(diff["added"]),
+            "modified": len(diff["modified"]),
+            "removed": len(diff["removed"]),
+            "unchanged": diff["unchanged"],
+        },
+    })
+    return result, 200
+
+def run_change_analysis_once(ticker, section, year=None):
+    """run_change_analysis, coalescing concurrent requests for the same ticker, year and section."""
+    key = ("changes", ticker.strip().upper(), year, section.strip().lower())
+    payload, status = singleflight(key, lambda: run_change_analysis(ticker, section, year))
+    if status == 200:
+        payload = dict(payload, ticker=ticker, section=section)
+    return payload, status
+
+@app.route("/analyze/10k/<ticker>/<section>/changes")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>/changes")
+def analyze_10k_changes(ticker, section, year=None):
+    """Summarize only what is new or revised in a section compared with the prior year's 10-K."""
+    _, error = parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        payload, status = run_change_analysis_once(ticker, section, year)
+        return jsonify(payload), status
+
+    except Exception as e:
+        logger.error(f"Unexpected error in analyze_10k_changes for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "2000"))
+
+def unique(values):
+    """Strip and de-duplicate values case-insensitively, keeping the first spelling."""
+    seen = set()
+    result = []
+    for value in values:
+        value = str(value).strip()
+        if value and value.lower() not in seen:
+            seen.add(value.lower())
+            result.append(value)
+    return result
+
+def batch_items(tickers, sections):
+    # Tickers vary fastest so concurrent workers spread over different filings
+    return [(ticker, section) for section in sections for ticker in tickers]
+
+def iter_batch_results(tickers, sections):
+    """
+    Analyze every (ticker, section) pair with bounded concurrency, yielding result dicts
+    as they complete. Each ticker's filing is resolved once and shared by its sections;
+    the filing fetch/parse and Gemini calls are shared through single-flight and the caches.
+    """
+    filings = {}
+    filings_lock = threading.Lock()
+
+    def resolve(ticker):
+        with filings_lock:
+            if ticker.upper() in filings:
+                return filings[ticker.upper()]
+        resolved = singleflight(("filing", ticker.upper()), lambda: resolve_10k(ticker))
+        with filings_lock:
+            filings[ticker.upper()] = resolved
+        return resolved
+
+    def analyze(ticker, section):
+        try:
+            url, failure = resolve(ticker)
+            if failure:
+                payload, status = {"error": failure["error"]}, failure["status"]
+            else:
+                payload, status = run_analysis(ticker, section, url=url)
+        except Exception as e:
+            logger.error(f"Unexpected error in batch item {ticker}/{section}: {e}")
+            payload, status = {"error": "Internal server error"}, 500
+        return dict(payload, ticker=ticker, section=section, status=status)
+
+    items = batch_items(tickers, sections)
+    executor = ThreadPoolExecutor(max_workers=max(1, BATCH_MAX_WORKERS), thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(analyze, ticker, section) for ticker, section in items]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        # Stop queued items if the client goes away mid-stream
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Analyze many tickers and sections, streaming one NDJSON line per item as it completes."""
+    params = request.get_json(silent=True) or {}
+    tickers = params.get("tickers")
+    sections = params.get("sections")
+    if not isinstance(tickers, list) or not isinstance(sections, list):
+        return jsonify({"error": "tickers and sections must be lists"}), 400
+    tickers = unique(tickers)
+    sections = unique(sections)
+    if not tickers or not sections:
+        return jsonify({"error": "tickers and sections are required"}), 400
+    if len(tickers) * len(sections) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_ITEMS} items"}), 400
+
+    logger.info(f"Starting batch of {len(tickers)} tickers x {len(sections)} sections")
+
+    def generate():
+        for result in iter_batch_results(tickers, sections):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"X-Accel-Buffering": "no"})
+
+# Financial metrics computed locally from SEC XBRL company facts, so numbers never depend on
+# Gemini reading tables. Each company's facts are cached as gzip JSON (also filled by
+# `flask ingest-submissions --companyfacts`); the annual values the metrics need are kept
+# next to them as NumPy arrays, one per input, indexed by fiscal year.
+COMPANYFACTS_URL = "https://data.sec.gov/api/xbrl/companyfacts/CIK{cik}.json"
+COMPANYFACTS_TTL_SECONDS = int(os.getenv("COMPANYFACTS_TTL_SECONDS", "86400"))
+FINANCIALS_DEFAULT_YEARS = 10
+FINANCIALS_MAX_YEARS = 50
+# Bump when the concepts or fact selection change so cached arrays are rebuilt
+FINANCIAL_COLUMNS_VERSION = 2
+
+# Metric inputs and the XBRL concepts that report them, in order of preference
+FINANCIAL_CONCEPTS = {
+    "revenue": ("us-gaap:Revenues", "us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax",
+                "us-gaap:SalesRevenueNet", "us-gaap:RevenueFromContractWithCustomerIncludingAssessedTax"),
+    "gross_profit": ("us-gaap:GrossProfit",),
+    "operating_income": ("us-gaap:OperatingIncomeLoss",),
+    "net_income": ("us-gaap:NetIncomeLoss", "us-gaap:ProfitLoss"),
+    "equity": ("us-gaap:StockholdersEquity",
+               "us-gaap:StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest"),
+    "long_term_debt": ("us-gaap:LongTermDebtNoncurrent", "us-gaap:LongTermDebt"),
+    "depreciation": ("us-gaap:DepreciationDepletionAndAmortization", "us-gaap:DepreciationAndAmortization",
+                     "us-gaap:DepreciationAmortizationAndAccretionNet", "us-gaap:Depreciation"),
+    "capex": ("us-gaap:PaymentsToAcquirePropertyPlantAndEquipment",),
+    "retained_earnings": ("us-gaap:RetainedEarningsAccumulatedDeficit",),
+    "public_float": ("dei:EntityPublicFloat",),
+}
+
+def companyfacts_columns_path(cik):
+    return os.path.join(COMPANYFACTS_DIR, f"CIK{cik}-v{FINANCIAL_COLUMNS_VERSION}.npz")
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def fetch_companyfacts(cik):
+    """Download a company's XBRL facts into COMPANYFACTS_DIR. Returns True on success."""
+    url = COMPANYFACTS_URL.format(cik=cik)
+    path = companyfacts_path(cik)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(COMPANYFACTS_DIR, exist_ok=True)
+        with sec_get(url, timeout=30, stream=True) as response:
+            if response.status_code == 404:
+                logger.warning(f"No XBRL company facts published for CIK {cik}")
+                return False
+            response.raise_for_status()
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                for chunk in response.iter_content(FILING_CHUNK_SIZE):
+                    SEC_DOWNLOADED_BYTES.labels("metadata").inc(len(chunk))
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+        logger.info(f"Downloaded company facts for CIK {cik}")
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to fetch company facts for CIK {cik}: {e}")
+    except OSError as e:
+        logger.error(f"Failed to store company facts for CIK {cik}: {e}")
+    with contextlib.suppress(OSError):
+        os.remove(tmp_path)
+    return False
+
+def _usd_facts(facts, concept):
+    taxonomy, name = concept.split(":")
+    return (((facts.get(taxonomy) or {}).get(name) or {}).get("units") or {}).get("USD") or []
+
+def _is_annual(fact):
+    days = (datetime.date.fromisoformat(fact["end"]) - datetime.date.fromisoformat(fact["start"])).days
+    return 350 <= days <= 380
+
+def _fiscal_years(annual_facts):
+    """
+    Return ({annual period end: fiscal year}, {accession: fiscal year of its 10-K}).
+    A 10-K's fy (with fp "FY") names the fiscal year of the latest annual period it reports;
+    its other periods are comparatives. Keying on it keeps 52/53-week years, and years that
+    end in early January, apart even when two of them end in the same calendar year. Periods
+    no 10-K names fall back to the calendar year they end in.
+    """
+    filings = {}
+    for fact in annual_facts:
+        filing = filings.setdefault(fact.get("accn"), {"end": fact["end"], "fy": None, "filed": ""})
+        filing["end"] = max(filing["end"], fact["end"])
+        filing["filed"] = max(filing["filed"], fact.get("filed", ""))
+        fy = fact.get("fy")
+        # Ignore fy values that cannot belong to the period, e.g. mis-tagged filings
+        if fact.get("fp") == "FY" and isinstance(fy, int) and abs(fy - int(fact["end"][:4])) <= 1:
+            filing["fy"] = fy
+
+    fiscal_years = {fact["end"]: int(fact["end"][:4]) for fact in annual_facts}
+    # Later filings win if two name the same period differently
+    for filing in sorted(filings.values(), key=lambda filing: filing["filed"]):
+        if filing["fy"] is not None:
+            fiscal_years[filing["end"]] = filing["fy"]
+    accession_years = {accn: fiscal_years[filing["end"]] for accn, filing in filings.items()}
+    return fiscal_years, accession_years
+
+def companyfacts_columns(data):
+    """
+    Reduce companyfacts JSON to annual values: (fiscal years, {input: float array}) with NaN
+    where a year is not reported. Only 10-K facts are used, and later filings (restatements)
+    win over earlier ones. Fiscal years are the filer's own (see _fiscal_years).
+    """
+    facts = data.get("facts") or {}
+    candidates = []
+    for field, concepts in FINANCIAL_CONCEPTS.items():
+        for rank, concept in enumerate(concepts):
+            for fact in _usd_facts(facts, concept):
+                if str(fact.get("form", "")).startswith("10-K") and "end" in fact and "val" in fact:
+                    candidates.append((field, rank, fact))
+
+    # Balance sheet values count only at fiscal year ends, i.e. where an annual period ends
+    fiscal_years, accession_years = _fiscal_years(
+        [fact for _, _, fact in candidates if "start" in fact and _is_annual(fact)])
+
+    chosen = {}
+    for field, rank, fact in candidates:
+        if "start" in fact:
+            if not _is_annual(fact):
+                continue
+            year = fiscal_years[fact["end"]]
+        elif field == "public_float":
+            # Reported on the cover page as of mid-year; it belongs to the fiscal year of its 10-K
+            year = accession_years.get(fact.get("accn"))
+            if year is None:
+                continue
+        elif fact["end"] in fiscal_years:
+            year = fiscal_years[fact["end"]]
+        else:
+            continue
+        score = (-rank, fact.get("filed", ""))
+        if (field, year) not in chosen or score > chosen[(field, year)][0]:
+            chosen[(field, year)] = (score, float(fact["val"]))
+
+    if not chosen:
+        return np.array([], dtype=np.int64), {field: np.array([]) for field in FINANCIAL_CONCEPTS}
+    first_year = min(year for _, year in chosen)
+    years = np.arange(first_year, max(year for _, year in chosen) + 1)
+    columns = {field: np.full(len(years), np.nan) for field in FINANCIAL_CONCEPTS}
+    for (field, year), (_, value) in chosen.items():
+        columns[field][year - first_year] = value
+    return years, columns
+
+def load_financial_columns(cik):
+    """Return (entity name, fiscal years, {input: array}) for a company, or None without XBRL facts."""
+    return singleflight(("financials", cik), lambda: _load_financial_columns(cik))
+
+def _load_financial_columns(cik):
+    facts_path = companyfacts_path(cik)
+    columns_path = companyfacts_columns_path(cik)
+    facts_mtime = _file_mtime(facts_path)
+    if facts_mtime is None or (COMPANYFACTS_TTL_SECONDS > 0
+                               and time.time() - facts_mtime > COMPANYFACTS_TTL_SECONDS):
+        if fetch_companyfacts(cik):
+            facts_mtime = _file_mtime(facts_path)
+        elif facts_mtime is None:
+            return None
+        # Otherwise keep serving the facts we already have
+
+    columns_mtime = _file_mtime(columns_path)
+    if columns_mtime is not None and columns_mtime >= facts_mtime:
+        try:
+            with np.load(columns_path) as arrays:
+                record_cache_result("financials", True)
+                return (str(arrays["entity_name"]), arrays["years"],
+                        {field: arrays[field] for field in FINANCIAL_CONCEPTS})
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable financial arrays {columns_path}: {e}")
+
+    record_cache_result("financials", False)
+    try:
+        with gzip.open(facts_path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, EOFError, ValueError) as e:
+        logger.error(f"Unreadable company facts for CIK {cik}: {e}")
+        return None
+    years, columns = companyfacts_columns(data)
+    entity_name = data.get("entityName") or ""
+
+    tmp_path = f"{columns_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, entity_name=np.array(entity_name), years=years, **columns)
+        os.replace(tmp_path, columns_path)
+    except OSError as e:
+        logger.warning(f"Failed to write financial arrays for CIK {cik}: {e}")
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+    return entity_name, years, columns
+
+def _ratio(numerator, denominator):
+    # Ratios over zero or negative denominators (e.g. negative equity) are not meaningful
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+def _prior_year(values):
+    prior = np.full_like(values, np.nan)
+    prior[..., 1:] = values[..., :-1]
+    return prior
+
+def compute_financial_metrics(inputs):
+    """
+    Buffett-style metrics from input arrays shaped (companies, years). Every metric is computed
+    for all companies and years at once; NaN marks values a company did not report.
+    """
+    equity = inputs["equity"]
+    prior_equity = _prior_year(equity)
+    average_equity = np.where(np.isnan(prior_equity), equity, (equity + prior_equity) / 2)
+    return {
+        "revenue": inputs["revenue"],
+        "net_income": inputs["net_income"],
+        # Owner earnings as in the 1986 letter, treating all capital spending as maintenance
+        "owner_earnings": inputs["net_income"] + inputs["depreciation"] - inputs["capex"],
+        "return_on_equity": _ratio(inputs["net_income"], average_equity),
+        "gross_margin": _ratio(inputs["gross_profit"], inputs["revenue"]),
+        "operating_margin": _ratio(inputs["operating_income"], inputs["revenue"]),
+        "net_margin": _ratio(inputs["net_income"], inputs["revenue"]),
+        "debt_to_equity": _ratio(inputs["long_term_debt"], equity),
+    }
+
+def retained_earnings_test(retained_earnings, market_value):
+    """
+    Buffett's one-dollar premise: between the first and last year where both are reported, every
+    dollar of earnings retained should have added at least a dollar of market value.
+    Returns (first index, last index, retained earnings added, market value added) per company,
+    with NaN amounts where fewer than two years are comparable.
+    """
+    comparable = np.isfinite(retained_earnings) & np.isfinite(market_value)
+    if not comparable.shape[-1]:
+        missing = np.full(comparable.shape[0], np.nan)
+        return np.zeros(comparable.shape[0], dtype=int), np.zeros(comparable.shape[0], dtype=int), missing, missing
+    enough = comparable.sum(axis=-1) >= 2
+    first = np.argmax(comparable, axis=-1)
+    last = comparable.shape[-1] - 1 - np.argmax(comparable[..., ::-1], axis=-1)
+    rows = np.arange(comparable.shape[0])
+    retained_added = np.where(enough, retained_earnings[rows, last] - retained_earnings[rows, first], np.nan)
+    market_added = np.where(enough, market_value[rows, last] - market_value[rows, first], np.nan)
+    return first, last, retained_added, market_added
+
+def _json_values(values):
+    return [None if np.isnan(value) else round(float(value), 4) for value in values]
+
+def financial_metrics(ciks, years=FINANCIALS_DEFAULT_YEARS, through=None):
+    """
+    Compute metrics for many companies at once over the last `years` fiscal years up to
+    `through` (default: the latest reported). Returns one dict per CIK, or None for a
+    company without XBRL facts.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, BATCH_MAX_WORKERS)) as executor:
+        loaded = list(executor.map(load_financial_columns, ciks))
+    available = [i for i, entry in enumerate(loaded) if entry is not None and len(entry[1])]
+    results = [None] * len(ciks)
+    if not available:
+        return results
+
+    # Align every company on one contiguous fiscal year axis
+    first_year = min(int(loaded[i][1][0]) for i in available)
+    last_year = max(int(loaded[i][1][-1]) for i in available)
+    axis = np.arange(first_year, last_year + 1)
+    inputs = {field: np.full((len(available), len(axis)), np.nan) for field in FINANCIAL_CONCEPTS}
+    for row, i in enumerate(available):
+        positions = loaded[i][1] - first_year
+        for field in FINANCIAL_CONCEPTS:
+            inputs[field][row, positions] = loaded[i][2][field]
+
+    metrics = compute_financial_metrics(inputs)
+    end = last_year if through is None else min(through, last_year)
+    window = (axis <= end) & (axis > end - years)
+    axis = axis[window]
+    metrics = {name: values[:, window] for name, values in metrics.items()}
+    first, last, retained_added, market_added = retained_earnings_test(
+        inputs["retained_earnings"][:, window], inputs["public_float"][:, window])
+    reported = np.any([np.isfinite(values) for values in metrics.values()], axis=0)
+
+    for row, i in enumerate(available):
+        result = {
+            "entity_name": loaded[i][0],
+            "years": [int(year) for year in axis[reported[row]]],
+            "metrics": {name: _json_values(values[row, reported[row]]) for name, values in metrics.items()},
+            "retained_earnings_test": None,
+        }
+        if not np.isnan(retained_added[row]):
+            retained, market = float(retained_added[row]), float(market_added[row])
+            result["retained_earnings_test"] = {
+                "from_year": int(axis[first[row]]),
+                "to_year": int(axis[last[row]]),
+                "retained_earnings_added": retained,
+                "market_value_added": market,
+                "market_value_per_retained_dollar": round(market / retained, 4) if retained > 0 else None,
+                "passes": market >= retained if retained > 0 else None,
+            }
+        results[i] = result
+    return results
+
+def company_financials(tickers, years=FINANCIALS_DEFAULT_YEARS):
+    """Resolve tickers and compute their metrics together. Returns (results, errors)."""
+    ciks = {}
+    errors = []
+    for ticker in tickers:
+        cik = get_cik(ticker)
+        if cik:
+            ciks[ticker] = cik
+        else:
+            errors.append({"ticker": ticker, "error": "Ticker not found", "status": 404})
+
+    results = []
+    for (ticker, cik), result in zip(ciks.items(), financial_metrics(list(ciks.values()), years)):
+        if result is None:
+            errors.append({"ticker": ticker, "error": "No XBRL financial data found", "status": 404})
+        else:
+            results.append(dict(result, ticker=ticker, cik=cik))
+    return results, errors
+
+def _format_amount(value):
+    if value is None:
+        return "n/a"
+    for divisor, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= divisor:
+            return f"${value / divisor:,.1f}{suffix}"
+    return f"${value:,.0f}"
+
+def _format_percent(value):
+    return "n/a" if value is None else f"{value * 100:.1f}%"
+
+def format_financials(result):
+    """Compact plain-text table of a financial_metrics result, for use in prompts."""
+    metrics = result["metrics"]
+    rows = ["Fiscal year | Revenue | Net income | Owner earnings | ROE | Gross margin | "
+            "Operating margin | Net margin | Long-term debt/equity"]
+    for i, year in enumerate(result["years"]):
+        debt_to_equity = metrics["debt_to_equity"][i]
+        rows.append(" | ".join([
+            str(year), _format_amount(metrics["revenue"][i]), _format_amount(metrics["net_income"][i]),
+            _format_amount(metrics["owner_earnings"][i]), _format_percent(metrics["return_on_equity"][i]),
+            _format_percent(metrics["gross_margin"][i]), _format_percent(metrics["operating_margin"][i]),
+            _format_percent(metrics["net_margin"][i]),
+            "n/a" if debt_to_equity is None else f"{debt_to_equity:.2f}",
+        ]))
+    test = result["retained_earnings_test"]
+    if test and test["market_value_per_retained_dollar"] is not None:
+        rows.append(f"Retained earnings {test['from_year']}-{test['to_year']}: "
+                    f"{_format_amount(test['retained_earnings_added'])} retained, public float changed by "
+                    f"{_format_amount(test['market_value_added'])} "
+                    f"(${test['market_value_per_retained_dollar']:.2f} per retained dollar)")
+    return "\n".join(rows)
+
+def filing_financials_context(accession):
+    """Key figures up to the fiscal year of an indexed filing, formatted for a prompt, or None."""
+    try:
+        conn = db_connect()
+        try:
+            row = conn.execute(f"SELECT cik, {_FISCAL_YEAR_SQL} FROM filings WHERE accession = ?",
+                               (accession,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        result = financial_metrics([row[0]], FINANCIALS_PROMPT_YEARS, through=row[1])[0]
+        return format_financials(result) if result and result["years"] else None
+    except Exception as e:
+        # The figures are an optional extra; never fail a summary over them
+        logger.warning(f"Financial figures unavailable for {accession}: {e}")
+        return None
+
+def parse_years(value):
+    """Validate the optional years window parameter. Returns (years, error message or None)."""
+    if value in (None, ""):
+        return FINANCIALS_DEFAULT_YEARS, None
+    try:
+        years = int(value)
+    except (TypeError, ValueError):
+        return None, "years must be a number"
+    if not 1 <= years <= FINANCIALS_MAX_YEARS:
+        return None, f"years must be between 1 and {FINANCIALS_MAX_YEARS}"
+    return years, None
+
+@app.route("/financials/<ticker>")
+def financials(ticker):
+    """Buffett-style metrics for one company, computed from its XBRL filings without Gemini."""
+    years, error = parse_years(request.args.get("years"))
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        results, errors = company_financials([ticker], years)
+        if errors:
+            return jsonify({"error": errors[0]["error"]}), errors[0]["status"]
+        return jsonify(results[0])
+
+    except Exception as e:
+        logger.error(f"Unexpected error in financials for {ticker}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route("/financials")
+def financials_many():
+    """Metrics for several companies (?tickers=AAPL,MSFT), computed together."""
+    years, error = parse_years(request.args.get("years"))
+    if error:
+        return jsonify({"error": error}), 400
+    tickers = unique(request.args.get("tickers", "").split(","))
+    if not tickers:
+        return jsonify({"error": "tickers is required"}), 400
+    if len(tickers) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_ITEMS} items"}), 400
+    try:
+        results, errors = company_financials(tickers, years)
+        return jsonify({"companies": results,
+                        "errors": [{"ticker": e["ticker"], "error": e["error"]} for e in errors]})
+
+    except Exception as e:
+        logger.error(f"Unexpected error in financials_many: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/analyze/10k/<ticker>/<section>/stream")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>/stream")
+def analyze_10k_stream(ticker, section, year=None):
+    """Server-Sent Events variant of analyze_10k that reports progress and streams the summary."""
+    _, error = parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+
+    def generate():
+        try:
+            for event, data in iter_analysis_events(ticker, section, year=year):
+                yield sse(event, data)
+        except Exception as e:
+            logger.error(f"Unexpected error in analyze_10k_stream for {ticker}/{section}: {e}")
+            yield sse("failed", {"error": "Internal server error", "status": 500})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Background job queue for analyses. Job state lives in the cache database so any
+# gunicorn worker can answer GET /jobs/<id>; the work runs on the accepting worker's pool.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+# A queued/running job not updated for this long is assumed lost (e.g. its worker restarted).
+# Workers touch their unfinished jobs every _JOB_HEARTBEAT_SECONDS, so long Gemini calls
+# do not make a live job look stale.
+JOB_STALE_SECONDS = 300
+_JOB_HEARTBEAT_SECONDS = JOB_STALE_SECONDS // 5
+_JOB_PROGRESS_INTERVAL = 0.5
+
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+_job_heartbeat = None
+
+_job_executor = ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="analysis-job")
+_JOB_COLUMNS = ("id", "ticker", "section", "status", "stage", "message", "summary",
+                "result", "error", "http_status", "created_at", "updated_at", "year")
+
+def update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = db_connect()
+    try:
+        with conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+def _job_heartbeat_loop():
+    while True:
+        time.sleep(_JOB_HEARTBEAT_SECONDS)
+        with _active_jobs_lock:
+            job_ids = list(_active_jobs)
+        if not job_ids:
+            continue
+        try:
+            conn = db_connect()
+            try:
+                with conn:
+                    conn.execute(
+                        f"UPDATE jobs SET updated_at = ? WHERE status IN ('queued', 'running') "
+                        f"AND id IN ({','.join('?' * len(job_ids))})", (time.time(), *job_ids))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to refresh job heartbeats: {e}")
+
+def track_job(job_id):
+    """Keep an unfinished job of this worker from being reported as lost."""
+    global _job_heartbeat
+    with _active_jobs_lock:
+        _active_jobs.add(job_id)
+        if _job_heartbeat is None:
+            _job_heartbeat = threading.Thread(target=_job_heartbeat_loop, name="job-heartbeat", daemon=True)
+            _job_heartbeat.start()
+
+def untrack_job(job_id):
+    with _active_jobs_lock:
+        _active_jobs.discard(job_id)
+
+def get_job(job_id):
+    """Return the job as a dict, or None if it does not exist."""
+    conn = db_connect()
+    try:
+        row = conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    job = dict(zip(_JOB_COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def insert_job(ticker_key, section_key, year=None):
+    """
+    Record a queued job and return (job id, True), or (id of an identical job that is
+    still queued or running, False).
+    """
+    now = time.time()
+    conn = db_connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                         (now - JOB_TTL_SECONDS,))
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE ticker = ? AND section = ? AND year IS ? "
+                "AND status IN ('queued', 'running') AND updated_at > ? ORDER BY created_at DESC LIMIT 1",
+                (ticker_key, section_key, year, now - JOB_STALE_SECONDS)).fetchone()
+            if row:
+                logger.info(f"Reusing in-progress job {row[0]} for {ticker_key}/{section_key}")
+                return row[0], False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, ticker, section, year, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)", (job_id, ticker_key, section_key, year, now, now))
+            return job_id, True
+    finally:
+        conn.close()
+
+def parse_year(value):
+    """Validate an optional fiscal year parameter. Returns (year or None, error message or None)."""
+    if value in (None, ""):
+        return None, None
+    try:
+        year = int(value)
+    except (TypeError, ValueError):
+        return None, "year must be a number"
+    if not 1993 <= year <= datetime.date.today().year:
+        return None, f"year must be between 1993 and {datetime.date.today().year}"
+    return year, None
+
+def submit_analysis_job(ticker, section, year=None):
+    """
+    Queue an analysis and return its job id. An identical job that is still queued or
+    running is reused rather than starting a new one.
+    """
+    ticker_key = ticker.strip().upper()
+    section_key = section.strip().lower()
+    job_id, created = insert_job(ticker_key, section_key, year)
+    if not created:
+        return job_id
+
+    track_job(job_id)
+    _job_executor.submit(_run_job, job_id, ticker_key, section_key, year)
+    logger.info(f"Queued job {job_id} for {ticker_key}/{section_key}")
+    return job_id
+
+def job_event_fields(job, event, data):
+    """
+    The jobs table columns to update for an analysis event, or None. job holds the
+    summary streamed so far and when it was last published.
+    """
+    if event == "progress":
+        return {"stage": data["stage"], "message": data["message"]}
+    if event == "summary":
+        job["chunks"].append(data["text"])
+        # Publish partial summaries periodically so pollers can render incrementally
+        if time.monotonic() - job["published"] < _JOB_PROGRESS_INTERVAL:
+            return None
+        job["published"] = time.monotonic()
+        return {"summary": "".join(job["chunks"])}
+    if event == "failed":
+        return {"status": "failed", "error": data["error"], "http_status": data["status"]}
+    if event == "done":
+        return {"status": "done", "summary": data["summary"], "result": json.dumps(data), "http_status": 200}
+    return None
+
+def _run_job(job_id, ticker, section, year=None):
+    try:
+        update_job(job_id, status="running")
+        job = {"chunks": [], "published": 0}
+        for event, data in iter_analysis_events(ticker, section, year=year):
+            fields = job_event_fields(job, event, data)
+            if fields:
+                update_job(job_id, **fields)
+            if event in ("failed", "done"):
+                return
+        update_job(job_id, status="failed", error="Internal server error", http_status=500)
+    except Exception as e:
+        logger.error(f"Unexpected error in job {job_id} for {ticker}/{section}: {e}")
+        try:
+            update_job(job_id, status="failed", error="Internal server error", http_status=500)
+        except sqlite3.Error:
+            pass
+    finally:
+        untrack_job(job_id)
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    params = request.get_json(silent=True) or request.form
+    ticker = (params.get("ticker") or "").strip()
+    section = (params.get("section") or "").strip()
+    if not ticker or not section:
+        return jsonify({"error": "ticker and section are required"}), 400
+    year, error = parse_year(params.get("year"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        job_id = submit_analysis_job(ticker, section, year)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to queue job for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    status_url = f"/jobs/{job_id}"
+    return jsonify({"job_id": job_id, "status_url": status_url}), 202, {"Location": status_url}
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    try:
+        job = get_job(job_id)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read job {job_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_payload(job))
+
+def job_payload(job):
+    payload = {key: job[key] for key in ("status", "stage", "message", "ticker", "section", "year", "summary")}
+    payload["job_id"] = job["id"]
+    if job["status"] in ("queued", "running") and job["updated_at"] < time.time() - JOB_STALE_SECONDS:
+        # The worker running it died or restarted; it will never finish
+        payload["status"] = "failed"
+        payload["error"] = "The analysis was interrupted, please try again"
+        payload["error_status"] = 500
+        return payload
+    if job["status"] == "done":
+        payload["result"] = job["result"]
+    elif job["status"] == "failed":
+        payload["error"] = job["error"]
+        payload["error_status"] = job["http_status"]
+    return payload
+
+# Nightly precompute for popular tickers, meant to be run from cron:
+#   flask --app buffett_app prefetch --watchlist watchlist.txt
+PREFETCH_WATCHLIST = os.getenv("PREFETCH_WATCHLIST", "")
+PREFETCH_SECTIONS = os.getenv(
+    "PREFETCH_SECTIONS",
+    "business,risk factors,cybersecurity,properties,legal proceedings,management's discussion and analysis,"
+    "quantitative and qualitative disclosures,financial statements,controls and procedures")
+DAILY_INDEX_URL = "https://www.sec.gov/Archives/edgar/daily-index/{year}/QTR{quarter}/form.{day}.idx"
+
+# Rows of a form.YYYYMMDD.idx file: form type, company name, CIK, date filed, file name
+_DAILY_INDEX_ROW_RE = re.compile(
+    r"^(?P<form>\S.*?)\s{2,}(?P<company>.*?)\s+(?P<cik>\d+)\s+(?P<date>\d{8}|\d{4}-\d{2}-\d{2})\s+"
+    r"(?P<path>edgar/data/\d+/(?P<accession>\d{10}-\d{2}-\d{6})\.txt)\s*$")
+
+def daily_index_url(day):
+    return DAILY_INDEX_URL.format(year=day.year, quarter=(day.month - 1) // 3 + 1, day=day.strftime("%Y%m%d"))
+
+def parse_daily_index(lines):
+    """Yield one dict per filing listed in an EDGAR daily form index."""
+    for line in lines:
+        match = _DAILY_INDEX_ROW_RE.match(line.rstrip("\r\n"))
+        if match:
+            yield {
+                "form": match.group("form").strip(),
+                "company": match.group("company").strip(),
+                "cik": match.group("cik").zfill(10),
+                "date_filed": match.group("date"),
+                "accession": match.group("accession"),
+            }
+
+def load_daily_index(day=None, path=None):
+    """Read the daily form index from a local copy or from EDGAR. Returns a list of filings or None."""
+    try:
+        if path:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", encoding="latin-1") as f:
+                return list(parse_daily_index(f))
+
+        url = daily_index_url(day)
+        logger.info(f"Fetching EDGAR daily index: {url}")
+        response = sec_get(url, timeout=30)
+        if response.status_code in (403, 404):
+            # No index is published for weekends and holidays
+            logger.warning(f"No daily index available for {day.isoformat()}")
+            return []
+        response.raise_for_status()
+        return list(parse_daily_index(response.content.decode("latin-1").splitlines()))
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to fetch daily index for {day}: {e}")
+        return None
+    except OSError as e:
+        logger.error(f"Failed to read daily index {path}: {e}")
+        return None
+
+def get_filing_url(cik, accession):
+    """Archive URL of a specific filing, refreshing the submissions index if it is not known yet."""
+    for force in (False, True):
+        if not refresh_submissions(cik, force=force):
+            return None
+        conn = db_connect()
+        try:
+            row = conn.execute("SELECT primary_document FROM filings WHERE cik = ? AND accession = ?",
+                               (cik, accession)).fetchone()
+        finally:
+            conn.close()
+        if row:
+            return filing_archive_url(cik, accession, row[0])
+    logger.warning(f"Filing {accession} not found in submissions for CIK {cik}")
+    return None
+
+def load_watchlist(value):
+    """Tickers from a comma-separated list, or from a file with one ticker per line."""
+    if value and os.path.isfile(value):
+        with open(value, encoding="utf-8") as f:
+            value = ",".join(line.split("#", 1)[0] for line in f)
+    return unique(re.split(r"[,\s]+", value or ""))
+
+def prefetch_filing(ticker, url, sections, audio=True):
+    """
+    Warm the filing, section, summary and (optionally) audio caches for one filing.
+    Returns (number of sections warmed, list of failure messages).
+    """
+    warmed = 0
+    failures = []
+    for section in sections:
+        try:
+            payload, status = run_analysis(ticker, section, url=url)
+            if status != 200:
+                # Sections missing from a particular 10-K are expected, anything else is a failure
+                if status != 404:
+                    failures.append(f"{ticker}/{section}: {payload.get('error')}")
+                logger.info(f"Prefetch skipped {ticker}/{section}: {payload.get('error')}")
+                continue
+            if audio and payload.get("audio_url"):
+                if not get_audio_path(payload["audio_url"].rsplit("/", 1)[-1]):
+                    failures.append(f"{ticker}/{section}: audio synthesis failed")
+                    continue
+            warmed += 1
+        except Exception as e:
+            logger.error(f"Unexpected error prefetching {ticker}/{section}: {e}")
+            failures.append(f"{ticker}/{section}: {e}")
+    return warmed, failures
+
+@app.cli.command("prefetch")
+@click.option("--watchlist", default=lambda: PREFETCH_WATCHLIST, show_default="$PREFETCH_WATCHLIST",
+              help="Comma-separated tickers, or a file with one ticker per line.")
+@click.option("--date", "day", type=click.DateTime(formats=["%Y-%m-%d", "%Y%m%d"]),
+              help="Filing date whose EDGAR daily index is scanned (default: yesterday).")
+@click.option("--index-file", type=click.Path(exists=True, dir_okay=False),
+              help="Local copy of a form.YYYYMMDD.idx daily index to scan instead of downloading it.")
+@click.option("--latest", is_flag=True,
+              help="Warm the latest 10-K of every watchlist ticker instead of only newly filed ones.")
+@click.option("--section", "sections", multiple=True,
+              help="Section to precompute; repeatable (default: $PREFETCH_SECTIONS).")
+@click.option("--audio/--no-audio", default=True, help="Also synthesize summary audio.")
+def prefetch_command(watchlist, day, index_file, latest, sections, audio):
+    """Precompute analyses for watchlist tickers that filed a 10-K, ahead of user demand."""
+    tickers = load_watchlist(watchlist)
+    if not tickers:
+        raise click.UsageError("No tickers to prefetch; pass --watchlist or set PREFETCH_WATCHLIST")
+    sections = unique(sections or PREFETCH_SECTIONS.split(","))
+
+    if latest:
+        filings = []
+        for ticker in tickers:
+            url, failure = resolve_10k(ticker)
+            if failure:
+                click.echo(f"{ticker}: {failure['error']}", err=True)
+            else:
+                filings.append((ticker, url))
+    else:
+        day = day.date() if day else datetime.date.today() - datetime.timedelta(days=1)
+        entries = load_daily_index(day=day, path=index_file)
+        if entries is None:
+            raise click.ClickException("Could not load the EDGAR daily index")
+
+        watched = {}
+        for ticker in tickers:
+            cik = get_cik(ticker)
+            if cik:
+                watched.setdefault(cik, ticker)
+            else:
+                click.echo(f"{ticker}: ticker not found", err=True)
+
+        filings = []
+        for entry in entries:
+            if entry["form"] == "10-K" and entry["cik"] in watched:
+                url = get_filing_url(entry["cik"], entry["accession"])
+                if url:
+                    filings.append((watched[entry["cik"]], url))
+        click.echo(f"{len(filings)} new 10-K filings from {len(watched)} watched companies in {len(entries)} index rows")
+
+    failures = []
+    executor = ThreadPoolExecutor(max_workers=max(1, BATCH_MAX_WORKERS), thread_name_prefix="prefetch")
+    with executor:
+        futures = {executor.submit(prefetch_filing, ticker, url, sections, audio): ticker for ticker, url in filings}
+        for future in as_completed(futures):
+            warmed, failed = future.result()
+            failures.extend(failed)
+            click.echo(f"{futures[future]}: {warmed}/{len(sections)} sections warmed")
+
+    for failure in failures:
+        click.echo(failure, err=True)
+    if failures:
+        raise click.ClickException(f"{len(failures)} prefetch items failed")
+
+# Bulk ingestion of the nightly EDGAR archives (submissions.zip, companyfacts.zip), read
+# member by member so neither archive is ever extracted or held in memory.
+COMPANYFACTS_DIR = os.getenv("COMPANYFACTS_DIR", os.path.join(".cache", "companyfacts"))
+INGEST_COMMIT_EVERY = 1000
+
+_ARCHIVE_MEMBER_RE = re.compile(r"^CIK(?P<cik>\d{10})(?P<page>-submissions-\d+)?\.json$")
+
+def _archive_member_date(info):
+    """HTTP date of a zip member's timestamp, for If-Modified-Since."""
+    modified = datetime.datetime(*info.date_time, tzinfo=datetime.timezone.utc)
+    return email.utils.format_datetime(modified, usegmt=True)
+
+def ingest_submissions_archive(path, forms=None):
+    """
+    Load a submissions.zip into the local filings index. forms limits which filings are kept
+    (None keeps all). Returns counts of companies, filings, pages and skipped members.
+    """
+    counts = {"companies": 0, "filings": 0, "pages": 0, "skipped": 0}
+    forms = set(forms) if forms else None
+    conn = db_connect()
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for i, info in enumerate(archive.infolist(), 1):
+                match = _ARCHIVE_MEMBER_RE.match(os.path.basename(info.filename))
+                if not match:
+                    continue
+                cik = match.group("cik")
+                try:
+                    with archive.open(info) as f:
+                        data = json.load(f)
+                    if match.group("page"):
+                        rows = filing_rows(cik, data)
+                    else:
+                        rows, pages = parse_submissions(cik, data)
+                    rows = [row for row in rows if forms is None or row[2] in forms]
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable submissions member {info.filename}: {e}")
+                    counts["skipped"] += 1
+                    continue
+
+                if match.group("page"):
+                    _write_submission_page(conn, cik, os.path.basename(info.filename), rows)
+                    counts["pages"] += 1
+                else:
+                    # The archive's timestamp makes the first refresh conditional, so companies
+                    # unchanged since the archive was built cost a 304 instead of a download
+                    _write_submissions(conn, cik, rows, None, _archive_member_date(info), pages)
+                    conn.executemany("INSERT OR REPLACE INTO tickers (ticker, cik) VALUES (?, ?)",
+                                     [(ticker.upper(), cik) for ticker in data.get("tickers") or [] if ticker])
+                    counts["companies"] += 1
+                counts["filings"] += len(rows)
+
+                if i % INGEST_COMMIT_EVERY == 0:
+                    conn.commit()
+                    logger.info(f"Ingested {counts['companies']} companies from {path}")
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+def companyfacts_path(cik):
+    return os.path.join(COMPANYFACTS_DIR, f"CIK{cik}.json.gz")
+
+def ingest_companyfacts_archive(path):
+    """Copy each member of a companyfacts.zip into COMPANYFACTS_DIR, gzip-compressed. Returns the count."""
+    count = 0
+    os.makedirs(COMPANYFACTS_DIR, exist_ok=True)
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            match = _ARCHIVE_MEMBER_RE.match(os.path.basename(info.filename))
+            if not match or match.group("page"):
+                continue
+            target = companyfacts_path(match.group("cik"))
+            tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            try:
+                with archive.open(info) as src, gzip.open(tmp_path, "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(tmp_path, target)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+            count += 1
+    return count
+
+@app.cli.command("ingest-submissions")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--companyfacts", type=click.Path(exists=True, dir_okay=False),
+              help="Also unpack a companyfacts.zip into $COMPANYFACTS_DIR.")
+@click.option("--form", "forms", multiple=True,
+              help="Only index filings of this form type; repeatable (default: all forms).")
+def ingest_submissions_command(path, companyfacts, forms):
+    """Load a local copy of EDGAR's bulk submissions.zip into the filings index."""
+    try:
+        counts = ingest_submissions_archive(path, forms)
+        click.echo(f"Indexed {counts['filings']} filings of {counts['companies']} companies "
+                   f"and {counts['pages']} older filing pages from {path}")
+        if counts["skipped"]:
+            click.echo(f"Skipped {counts['skipped']} unreadable members", err=True)
+        if companyfacts:
+            count = ingest_companyfacts_archive(companyfacts)
+            click.echo(f"Stored company facts for {count} companies in {COMPANYFACTS_DIR}")
+    except (zipfile.BadZipFile, OSError, sqlite3.Error) as e:
+        raise click.ClickException(f"Ingestion failed: {e}")
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
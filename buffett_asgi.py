@@ -0,0 +1,691 @@
+"""
+Async (ASGI) variant of buffett_app for holding many concurrent analyses in one process.
+
+    hypercorn buffett_asgi:app --bind 0.0.0.0:5000
+    uvicorn buffett_asgi:app --host 0.0.0.0 --port 5000
+
+sec.gov is reached through a pooled httpx.AsyncClient under the same host-wide rate limit, and
+Gemini through the client's async API, so an analysis waiting on the network does not hold a
+thread. HTML parsing, section extraction, TTS and the caches are shared with buffett_app; the
+CPU-bound and SQLite steps run in worker threads. Routes and payloads match buffett_app.
+"""
+import asyncio
+import contextlib
+import gzip
+import json
+import os
+import sqlite3
+import uuid
+
+import httpx
+from quart import Quart, Response, jsonify, render_template, request, send_file
+
+import buffett_app as core
+from buffett_app import logger
+
+app = Quart(__name__)
+
+sec_client = None
+
+@app.before_serving
+async def open_sec_client():
+    global sec_client
+    limits = httpx.Limits(max_connections=core.SEC_POOL_SIZE, max_keepalive_connections=core.SEC_POOL_SIZE)
+    sec_client = httpx.AsyncClient(
+        headers=dict(core.sec_session.headers),
+        timeout=httpx.Timeout(30, connect=10),
+        transport=httpx.AsyncHTTPTransport(limits=limits, retries=3),
+    )
+    # Load the ticker index before the first request instead of during it
+    await asyncio.to_thread(core.ensure_ticker_index)
+
+@app.after_serving
+async def close_sec_client():
+    await sec_client.aclose()
+
+_flights = {}
+
+async def singleflight(key, fn):
+    """Await fn(), sharing one in-flight call between concurrent callers with the same key."""
+    task = _flights.get(key)
+    if task is None:
+        task = _flights[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: _flights.pop(key, None))
+    else:
+        logger.info(f"Waiting on in-flight computation for {key}")
+    # Shield so a caller that disconnects does not cancel the work for everyone else
+    return await asyncio.shield(task)
+
+async def acquire_sec_token():
+    """Wait, without blocking the event loop, until a request to the SEC may be sent."""
+    if core.SEC_MAX_REQUESTS_PER_SECOND <= 0:
+        return
+    while True:
+        try:
+            wait = core.take_sec_token()
+        except OSError as e:
+            logger.warning(f"Shared SEC rate limiter unavailable, falling back to per-process limit: {e}")
+            core.SEC_RATE_LIMIT_FILE = None
+            continue
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+async def sec_get(url, headers=None):
+    """GET a sec.gov URL through the shared async pool, honoring the SEC rate limit."""
+    for attempt in range(core.SEC_MAX_RETRIES + 1):
+        await acquire_sec_token()
+        response = await sec_client.get(url, headers=headers)
+        if response.status_code not in core.SEC_RETRY_STATUSES or attempt == core.SEC_MAX_RETRIES:
+            break
+        await asyncio.sleep(core.sec_retry_delay(response, attempt))
+    core.SEC_DOWNLOADED_BYTES.labels("metadata").inc(len(response.content))
+    return response
+
+async def refresh_submissions(cik):
+    """Async counterpart of buffett_app.refresh_submissions."""
+    state = await asyncio.to_thread(core.load_submissions_state, cik)
+    if core.submissions_fresh(state):
+        return True
+    return await singleflight(("submissions", cik), lambda: _refresh_submissions(cik, state))
+
+async def _refresh_submissions(cik, state):
+    try:
+        url, request_headers = core.submissions_request(cik, state)
+        response = await sec_get(url, headers=request_headers)
+        if response.status_code == 304:
+            logger.info(f"Submissions for CIK {cik} not modified since last refresh")
+            await asyncio.to_thread(core.touch_submissions, cik)
+            return True
+        response.raise_for_status()
+        rows, pages = core.parse_submissions(cik, response.json())
+    except httpx.HTTPError as e:
+        # Serve whatever we already have rather than failing the request
+        logger.error(f"Failed to refresh submissions for CIK {cik}: {e}")
+        return state is not None
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Unexpected data structure in submissions response for CIK {cik}: {e}")
+        return state is not None
+
+    await asyncio.to_thread(core.store_submissions, cik, rows,
+                            response.headers.get("ETag"), response.headers.get("Last-Modified"), pages)
+    logger.info(f"Indexed {len(rows)} recent filings for CIK {cik}")
+    return True
+
+async def get_latest_10k_url(cik):
+    """Fetch latest 10-K filing URL for a company."""
+    with core.observe_stage("get_latest_10k_url"):
+        try:
+            logger.info(f"Fetching latest 10-K URL for CIK: {cik}")
+            if not await refresh_submissions(cik):
+                return None
+            row = await asyncio.to_thread(core.latest_10k_filing, cik)
+        except sqlite3.Error as e:
+            logger.error(f"Submissions index lookup failed for CIK {cik}: {e}")
+            return None
+
+    if row:
+        archive_url = core.filing_archive_url(cik, row[0], row[1])
+        logger.info(f"Found 10-K URL: {archive_url}")
+        return archive_url
+    logger.warning(f"No 10-K found for CIK: {cik}")
+    return None
+
+async def _load_submission_page(cik, name):
+    try:
+        response = await sec_get(core.submission_page_url(name))
+        response.raise_for_status()
+        rows = core.filing_rows(cik, response.json())
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to fetch submissions page {name}: {e}")
+        return False
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Unexpected data structure in submissions page {name}: {e}")
+        return False
+    await asyncio.to_thread(core.store_submission_page, cik, name, rows)
+    logger.info(f"Indexed {len(rows)} older filings for CIK {cik} from {name}")
+    return True
+
+async def get_10k_url_for_year(cik, year):
+    """Fetch the URL of a company's 10-K for the fiscal year ending in year."""
+    with core.observe_stage("get_10k_url_for_year"):
+        try:
+            logger.info(f"Fetching {year} 10-K URL for CIK: {cik}")
+            if not await refresh_submissions(cik):
+                return None
+            row = await asyncio.to_thread(core.fiscal_year_10k_filing, cik, year)
+            if row is None:
+                for name in await asyncio.to_thread(core.pending_submission_pages, cik, year):
+                    if await singleflight(("submission-page", cik, name), lambda: _load_submission_page(cik, name)):
+                        row = await asyncio.to_thread(core.fiscal_year_10k_filing, cik, year)
+                        if row:
+                            break
+        except sqlite3.Error as e:
+            logger.error(f"Submissions index lookup failed for CIK {cik}: {e}")
+            return None
+
+    if row:
+        archive_url = core.filing_archive_url(cik, row[0], row[1])
+        logger.info(f"Found {year} 10-K URL: {archive_url}")
+        return archive_url
+    logger.warning(f"No {year} 10-K found for CIK: {cik}")
+    return None
+
+async def resolve_10k(ticker, year=None):
+    """
+    Steps 1 and 2 of the pipeline: the latest 10-K, or the one for fiscal year year.
+    Returns (10-K URL, None) or (None, failure dict).
+    """
+    # The ticker index is in memory once loaded, but the first lookup may have to fetch it
+    cik = await asyncio.to_thread(core.get_cik, ticker)
+    if not cik:
+        logger.warning(f"CIK lookup failed for ticker: {ticker}")
+        return None, {"error": "Ticker not found", "status": 404}
+
+    if year is None:
+        url = await get_latest_10k_url(cik)
+        if not url:
+            logger.warning(f"No 10-K found for CIK: {cik}")
+            return None, {"error": "No 10-K found", "status": 404}
+    else:
+        url = await get_10k_url_for_year(cik, year)
+        if not url:
+            logger.warning(f"No {year} 10-K found for CIK: {cik}")
+            return None, {"error": f"No 10-K found for {year}", "status": 404}
+    return url, None
+
+def _open_filing_cache_entry(path):
+    os.makedirs(core.FILING_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    return tmp_path, gzip.open(tmp_path, "wb", compresslevel=6)
+
+def _commit_filing_cache_entry(cache_file, tmp_path, path):
+    cache_file.close()
+    os.replace(tmp_path, path)
+    core.evict_filing_cache()
+    core.purge_summary_stores()
+
+def _discard_filing_cache_entry(cache_file, tmp_path):
+    cache_file.close()
+    with contextlib.suppress(OSError):
+        os.remove(tmp_path)
+
+async def download_filing(url):
+    """
+    Stream a filing document into buffett_app's on-disk filing cache, unless it is cached
+    already. All disk work, including the cache lookup, runs in worker threads.
+    """
+    if await asyncio.to_thread(core.lookup_cached_filing, url):
+        return
+    path = core.filing_cache_path(url)
+    tmp_path, cache_file = await asyncio.to_thread(_open_filing_cache_entry, path)
+    try:
+        await acquire_sec_token()
+        async with sec_client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(core.FILING_CHUNK_SIZE):
+                core.SEC_DOWNLOADED_BYTES.labels("filing").inc(len(chunk))
+                # Compression is CPU work, keep it off the event loop
+                await asyncio.to_thread(cache_file.write, chunk)
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(_discard_filing_cache_entry, cache_file, tmp_path))
+        raise
+    await asyncio.to_thread(_commit_filing_cache_entry, cache_file, tmp_path, path)
+
+async def get_10k_sections(url):
+    """
+    Sections of a filing, as buffett_app.get_10k_sections. The document is downloaded
+    asynchronously into the filing cache first, so the parse in a worker thread reads it from disk.
+    """
+    section_path = core.section_cache_path(url)
+    if core.FILING_CACHE_MAX_BYTES <= 0 or (section_path and os.path.exists(section_path)):
+        return await asyncio.to_thread(core.get_10k_sections, url)
+    try:
+        await singleflight(("filing", url), lambda: download_filing(url))
+    except (httpx.HTTPError, OSError) as e:
+        logger.error(f"Failed to download 10-K from {url}: {e}")
+        return None
+    # The download counted the filing cache lookup, so the parse must not count it again
+    return await asyncio.to_thread(core.get_10k_sections, url, core.cached_10k_text)
+
+async def generate_summary(prompt, config=None):
+    response = await core.client.aio.models.generate_content(
+        model=core.GEMINI_MODEL,
+        config=config or core.summary_config(),
+        contents=prompt
+    )
+    core.record_gemini_usage(response, core.GEMINI_MODEL)
+    return response.text
+
+async def generate_summary_stream(prompt, config):
+    chunk = None
+    async for chunk in await core.client.aio.models.generate_content_stream(
+            model=core.GEMINI_MODEL, config=config, contents=prompt):
+        if chunk.text:
+            yield chunk.text
+    # Usage metadata is cumulative, so only the final chunk is counted
+    if chunk is not None:
+        core.record_gemini_usage(chunk, core.GEMINI_MODEL)
+
+async def build_summary_prompt(section_name, section_text, accession=None):
+    """Async counterpart of buffett_app.build_summary_prompt; chunk summaries run concurrently."""
+    if core.estimate_tokens(section_text) <= core.SUMMARY_CHUNK_TOKENS:
+        prompt = core.SUMMARY_PROMPT_TEMPLATE.format(section_name=section_name, section_text=section_text)
+        return await asyncio.to_thread(core.with_financials, prompt, section_name, accession)
+
+    chunks = core.chunk_section_text(section_text)
+    keys = [core.chunk_summary_key(section_name, chunk) for chunk in chunks]
+    summaries = await asyncio.to_thread(core.load_chunk_summaries, keys)
+    missing = {key: chunk for key, chunk in zip(keys, chunks) if key not in summaries}
+    logger.info(f"Summarizing section '{section_name}' in {len(chunks)} chunks, {len(missing)} not cached")
+    limit = asyncio.Semaphore(max(1, core.SUMMARY_MAX_WORKERS))
+
+    async def summarize(key, chunk):
+        async with limit:
+            summary = await generate_summary(core.CHUNK_PROMPT_TEMPLATE.format(
+                section_name=section_name, section_text=chunk))
+        await asyncio.to_thread(core.store_chunk_summary, key, summary)
+        summaries[key] = summary
+
+    await asyncio.gather(*(summarize(key, chunk) for key, chunk in missing.items()))
+    partial_summaries = [summaries[key] for key in keys]
+    combined = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries))
+    prompt = core.REDUCE_PROMPT_TEMPLATE.format(section_name=section_name, partial_summaries=combined)
+    return await asyncio.to_thread(core.with_financials, prompt, section_name, accession)
+
+async def build_summary_request(section_name, section_text, accession=None, filing_sections=None):
+    # Context caches are created once per filing, so the blocking client is fine here
+    cache_name = await asyncio.to_thread(core.get_filing_context_cache, accession, filing_sections)
+    if cache_name:
+        prompt = core.CACHED_SECTION_PROMPT_TEMPLATE.format(section_name=section_name)
+        prompt = await asyncio.to_thread(core.with_financials, prompt, section_name, accession)
+        return prompt, core.summary_config(cache_name), cache_name
+    return await build_summary_prompt(section_name, section_text, accession), core.summary_config(), None
+
+async def analyze_with_gemini(section_name, section_text, accession=None, filing_sections=None):
+    """Send section text to Gemini for summarization, reusing cached summaries for the same filing."""
+    key = core.summary_cache_key(section_name, section_text, accession)
+    with core.observe_stage("analyze_with_gemini"):
+        return await singleflight(("summary",) + key,
+                                  lambda: _analyze_with_gemini(section_name, section_text, key, accession,
+                                                               filing_sections))
+
+async def _analyze_with_gemini(section_name, section_text, key, accession, filing_sections):
+    try:
+        cached = await asyncio.to_thread(core.load_cached_summary, key)
+        core.record_cache_result("summaries", cached is not None)
+        if cached is not None:
+            logger.info(f"Summary cache hit for section '{section_name}' of {key[0]}")
+            return cached
+
+        logger.info(f"Analyzing section '{section_name}' with Gemini AI")
+        prompt, config, cache_name = await build_summary_request(section_name, section_text, accession,
+                                                                 filing_sections)
+        try:
+            summary = await generate_summary(prompt, config)
+        except Exception as e:
+            if not cache_name:
+                raise
+            # The cached content may have expired or been deleted; retry with the full text
+            logger.warning(f"Summary with context cache {cache_name} failed, retrying without it: {e}")
+            await asyncio.to_thread(core.invalidate_filing_context_cache, accession, cache_name)
+            summary = await generate_summary(await build_summary_prompt(section_name, section_text, accession))
+        logger.info(f"Successfully generated summary for section '{section_name}'")
+        if summary:
+            await asyncio.to_thread(core.store_cached_summary, key, summary)
+        return summary
+    except Exception as e:
+        logger.error(f"Failed to analyze section '{section_name}' with Gemini: {e}")
+        return f"Error: Unable to generate summary for {section_name}. {str(e)}"
+
+async def stream_analysis_with_gemini(section_name, section_text, accession=None, filing_sections=None):
+    """Like analyze_with_gemini, but yields the summary in chunks as Gemini generates it."""
+    key = core.summary_cache_key(section_name, section_text, accession)
+    with core.observe_stage("analyze_with_gemini"):
+        cached = await asyncio.to_thread(core.load_cached_summary, key)
+        core.record_cache_result("summaries", cached is not None)
+        if cached is not None:
+            logger.info(f"Summary cache hit for section '{section_name}' of {key[0]}")
+            yield cached
+            return
+
+        logger.info(f"Streaming analysis of section '{section_name}' with Gemini AI")
+        prompt, config, cache_name = await build_summary_request(section_name, section_text, accession,
+                                                                 filing_sections)
+        chunks = []
+        try:
+            async for text in generate_summary_stream(prompt, config):
+                chunks.append(text)
+                yield text
+        except Exception as e:
+            if not cache_name or chunks:
+                raise
+            logger.warning(f"Summary with context cache {cache_name} failed, retrying without it: {e}")
+            await asyncio.to_thread(core.invalidate_filing_context_cache, accession, cache_name)
+            prompt = await build_summary_prompt(section_name, section_text, accession)
+            async for text in generate_summary_stream(prompt, core.summary_config()):
+                chunks.append(text)
+                yield text
+
+        summary = "".join(chunks)
+        logger.info(f"Successfully streamed summary for section '{section_name}'")
+        if summary:
+            await asyncio.to_thread(core.store_cached_summary, key, summary)
+
+async def iter_analysis_events(ticker, section, stream_summary=True, url=None, year=None):
+    """Async counterpart of buffett_app.iter_analysis_events, yielding the same events."""
+    label = core.metrics_section_label(section)
+    # Each request runs in its own task, so the label does not leak between requests
+    core.metrics_section.set(label)
+    core.ANALYSES_IN_PROGRESS.labels(label).inc()
+    try:
+        logger.info(f"Starting analysis for ticker: {ticker}, section: {section}")
+        if url is None:
+            which = "latest" if year is None else str(year)
+            yield "progress", {"stage": "filing", "message": f"Finding the {which} 10-K filing for {ticker}..."}
+            url, failure = await resolve_10k(ticker, year)
+            if failure:
+                yield "failed", failure
+                return
+
+        yield "progress", {"stage": "sections", "message": "Reading the 10-K..."}
+        sections = await get_10k_sections(url)
+        if sections is None:
+            logger.error(f"Failed to fetch 10-K text from URL: {url}")
+            yield "failed", {"error": "Failed to fetch 10-K content", "status": 500}
+            return
+
+        if not sections:
+            logger.warning("No sections extracted from 10-K")
+            yield "failed", {"error": "No sections found in 10-K", "status": 404}
+            return
+
+        section_text = core.find_section(sections, section)
+        if section_text is None:
+            logger.warning(f"Requested section '{section}' not found. Available: {list(sections.keys())}")
+            yield "failed", {"error": f"Section {section} not found", "status": 404}
+            return
+
+        yield "progress", {"stage": "summary", "message": "Summarizing like Warren Buffett..."}
+        filing = core.parse_filing_url(url)
+        accession = filing[1] if filing else None
+        if stream_summary:
+            chunks = []
+            try:
+                async for chunk in stream_analysis_with_gemini(section, section_text,
+                                                               accession=accession, filing_sections=sections):
+                    chunks.append(chunk)
+                    yield "summary", {"text": chunk}
+            except Exception as e:
+                # A partial summary must never be reported (or voiced) as the result
+                logger.error(f"Failed to stream analysis of section '{section}' with Gemini: {e}")
+                yield "failed", {"error": "Failed to generate summary", "status": 500}
+                return
+            summary = "".join(chunks)
+        else:
+            summary = await analyze_with_gemini(section, section_text, accession=accession,
+                                                filing_sections=sections)
+        if not summary or summary.startswith("Error:"):
+            logger.error(f"Gemini analysis failed for section: {section}")
+            yield "failed", {"error": "Failed to generate summary", "status": 500}
+            return
+
+        logger.info(f"Successfully completed analysis for {ticker} - {section}")
+        yield "done", await asyncio.to_thread(core.analysis_result, ticker, section, summary, year)
+    finally:
+        core.ANALYSES_IN_PROGRESS.labels(label).dec()
+
+async def run_analysis(ticker, section, url=None, year=None):
+    """Run the analysis pipeline to completion. Returns (JSON payload, HTTP status)."""
+    async for event, data in iter_analysis_events(ticker, section, stream_summary=False, url=url, year=year):
+        if event == "failed":
+            return {"error": data["error"]}, data["status"]
+        if event == "done":
+            return data, 200
+    return {"error": "Internal server error"}, 500
+
+async def run_analysis_once(ticker, section, year=None):
+    """run_analysis, coalescing concurrent requests for the same ticker, year and section."""
+    key = ("analysis", ticker.strip().upper(), year, section.strip().lower())
+    payload, status = await singleflight(key, lambda: run_analysis(ticker, section, year=year))
+    if status == 200:
+        payload = dict(payload, ticker=ticker, section=section)
+    return payload, status
+
+@app.route("/")
+async def home():
+    return await render_template("index.html")
+
+@app.route("/metrics")
+async def metrics():
+    return Response(core.render_metrics(), mimetype=core.prometheus_client.CONTENT_TYPE_LATEST)
+
+@app.route("/cache/stats")
+async def cache_stats():
+    return jsonify(core.cache_stats_snapshot())
+
+@app.route("/audio/<audio_id>")
+async def get_audio(audio_id):
+    if not core.AUDIO_ID_RE.match(audio_id):
+        return jsonify({"error": "Audio not found"}), 404
+    try:
+        path = await asyncio.to_thread(core.get_audio_path, audio_id)
+    except Exception as e:
+        logger.warning(f"TTS generation failed for audio {audio_id}: {e}")
+        return jsonify({"error": "Failed to generate audio"}), 502
+    if not path:
+        return jsonify({"error": "Audio not found"}), 404
+
+    # Audio ids are content hashes, so the file never changes and can be cached indefinitely
+    response = await send_file(path, mimetype="audio/wav", conditional=True, cache_timeout=31536000)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route("/analyze/10k/<ticker>/<section>")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>")
+async def analyze_10k(ticker, section, year=None):
+    _, error = core.parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        payload, status = await run_analysis_once(ticker, section, year)
+        return jsonify(payload), status
+
+    except Exception as e:
+        logger.error(f"Unexpected error in analyze_10k for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route("/analyze/10k/<ticker>/<section>/stream")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>/stream")
+async def analyze_10k_stream(ticker, section, year=None):
+    """Server-Sent Events variant of analyze_10k that reports progress and streams the summary."""
+    _, error = core.parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+
+    async def generate():
+        try:
+            async for event, data in iter_analysis_events(ticker, section, year=year):
+                yield core.sse(event, data)
+        except Exception as e:
+            logger.error(f"Unexpected error in analyze_10k_stream for {ticker}/{section}: {e}")
+            yield core.sse("failed", {"error": "Internal server error", "status": 500})
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/analyze/10k/<ticker>/<section>/changes")
+@app.route("/analyze/10k/<ticker>/<int:year>/<section>/changes")
+async def analyze_10k_changes(ticker, section, year=None):
+    """Summarize only what is new or revised in a section compared with the prior year's 10-K."""
+    _, error = core.parse_year(year)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        # Change summaries compare two filings and are rarely requested; run the sync pipeline in a thread
+        payload, status = await asyncio.to_thread(core.run_change_analysis_once, ticker, section, year)
+        return jsonify(payload), status
+
+    except Exception as e:
+        logger.error(f"Unexpected error in analyze_10k_changes for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+async def iter_batch_results(tickers, sections):
+    """Async counterpart of buffett_app.iter_batch_results."""
+    limit = asyncio.Semaphore(max(1, core.BATCH_MAX_WORKERS))
+    filings = {}
+
+    async def resolve(ticker):
+        if ticker.upper() not in filings:
+            filings[ticker.upper()] = await singleflight(("filing", ticker.upper()),
+                                                         lambda: resolve_10k(ticker))
+        return filings[ticker.upper()]
+
+    async def analyze(ticker, section):
+        async with limit:
+            try:
+                url, failure = await resolve(ticker)
+                if failure:
+                    payload, status = {"error": failure["error"]}, failure["status"]
+                else:
+                    payload, status = await run_analysis(ticker, section, url=url)
+            except Exception as e:
+                logger.error(f"Unexpected error in batch item {ticker}/{section}: {e}")
+                payload, status = {"error": "Internal server error"}, 500
+        return dict(payload, ticker=ticker, section=section, status=status)
+
+    tasks = [asyncio.ensure_future(analyze(ticker, section)) for ticker, section in core.batch_items(tickers, sections)]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # Stop outstanding items if the client goes away mid-stream
+        for task in tasks:
+            task.cancel()
+
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """Analyze many tickers and sections, streaming one NDJSON line per item as it completes."""
+    params = await request.get_json(silent=True) or {}
+    tickers = params.get("tickers")
+    sections = params.get("sections")
+    if not isinstance(tickers, list) or not isinstance(sections, list):
+        return jsonify({"error": "tickers and sections must be lists"}), 400
+    tickers = core.unique(tickers)
+    sections = core.unique(sections)
+    if not tickers or not sections:
+        return jsonify({"error": "tickers and sections are required"}), 400
+    if len(tickers) * len(sections) > core.BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch exceeds {core.BATCH_MAX_ITEMS} items"}), 400
+
+    logger.info(f"Starting batch of {len(tickers)} tickers x {len(sections)} sections")
+
+    async def generate():
+        async for result in iter_batch_results(tickers, sections):
+            yield json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.route("/financials/<ticker>")
+async def financials(ticker):
+    """Buffett-style metrics for one company, computed from its XBRL filings without Gemini."""
+    years, error = core.parse_years(request.args.get("years"))
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        # The metrics are vectorized NumPy work over locally cached facts; run it in a thread
+        results, errors = await asyncio.to_thread(core.company_financials, [ticker], years)
+        if errors:
+            return jsonify({"error": errors[0]["error"]}), errors[0]["status"]
+        return jsonify(results[0])
+
+    except Exception as e:
+        logger.error(f"Unexpected error in financials for {ticker}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route("/financials")
+async def financials_many():
+    """Metrics for several companies (?tickers=AAPL,MSFT), computed together."""
+    years, error = core.parse_years(request.args.get("years"))
+    if error:
+        return jsonify({"error": error}), 400
+    tickers = core.unique(request.args.get("tickers", "").split(","))
+    if not tickers:
+        return jsonify({"error": "tickers is required"}), 400
+    if len(tickers) > core.BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Batch exceeds {core.BATCH_MAX_ITEMS} items"}), 400
+    try:
+        results, errors = await asyncio.to_thread(core.company_financials, tickers, years)
+        return jsonify({"companies": results,
+                        "errors": [{"ticker": e["ticker"], "error": e["error"]} for e in errors]})
+
+    except Exception as e:
+        logger.error(f"Unexpected error in financials_many: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+# Jobs share the jobs table with buffett_app, but run as tasks on the event loop
+_job_tasks = set()
+
+async def update_job(job_id, **fields):
+    await asyncio.to_thread(core.update_job, job_id, **fields)
+
+async def _run_job(job_id, ticker, section, year=None):
+    try:
+        await update_job(job_id, status="running")
+        job = {"chunks": [], "published": 0}
+        async for event, data in iter_analysis_events(ticker, section, year=year):
+            fields = core.job_event_fields(job, event, data)
+            if fields:
+                await update_job(job_id, **fields)
+            if event in ("failed", "done"):
+                return
+        await update_job(job_id, status="failed", error="Internal server error", http_status=500)
+    except Exception as e:
+        logger.error(f"Unexpected error in job {job_id} for {ticker}/{section}: {e}")
+        try:
+            await update_job(job_id, status="failed", error="Internal server error", http_status=500)
+        except sqlite3.Error:
+            pass
+    finally:
+        core.untrack_job(job_id)
+
+@app.route("/jobs", methods=["POST"])
+async def create_job():
+    params = await request.get_json(silent=True) or await request.form
+    ticker = (params.get("ticker") or "").strip()
+    section = (params.get("section") or "").strip()
+    if not ticker or not section:
+        return jsonify({"error": "ticker and section are required"}), 400
+    year, error = core.parse_year(params.get("year"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        job_id, created = await asyncio.to_thread(core.insert_job, ticker.upper(), section.lower(), year)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to queue job for {ticker}/{section}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    if created:
+        core.track_job(job_id)
+        task = asyncio.ensure_future(_run_job(job_id, ticker.upper(), section.lower(), year))
+        # Keep a reference so the task is not garbage collected while it runs
+        _job_tasks.add(task)
+        task.add_done_callback(_job_tasks.discard)
+        logger.info(f"Queued job {job_id} for {ticker.upper()}/{section.lower()}")
+
+    status_url = f"/jobs/{job_id}"
+    return jsonify({"job_id": job_id, "status_url": status_url}), 202, {"Location": status_url}
+
+@app.route("/jobs/<job_id>")
+async def job_status(job_id):
+    try:
+        job = await asyncio.to_thread(core.get_job, job_id)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to read job {job_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(core.job_payload(job))
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,28 @@
+"""
+Unit tests for buffett_app's self-contained logic, on small hand-written inputs. They run
+offline and need neither a Gemini key nor the benchmark plugin.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# buffett_app reads its configuration at import time
+_test_cache_root = tempfile.mkdtemp(prefix="buffett-tests-")
+os.environ.setdefault("GOOGLE_API_KEY", "test-placeholder-key")
+os.environ["TICKER_INDEX_REFRESH_SECONDS"] = "0"
+os.environ["SEC_MAX_REQUESTS_PER_SECOND"] = "0"
+os.environ["CACHE_DB_PATH"] = os.path.join(_test_cache_root, "buffett.sqlite3")
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import buffett_app  # noqa: E402
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Point the cache database and lock files at a fresh directory."""
+    monkeypatch.setattr(buffett_app, "CACHE_DB_PATH", str(tmp_path / "buffett.sqlite3"))
+    monkeypatch.setattr(buffett_app, "SINGLEFLIGHT_LOCK_DIR", str(tmp_path / "locks"))
+    return tmp_path
@@ -0,0 +1,58 @@
+import buffett_app
+from buffett_app import diff_paragraphs
+
+MOAT = ("Our brand lets us charge more than competitors for the same product and customers "
+        "keep returning to our stores year after year because they trust the quality we offer")
+# The same paragraph with its last word changed: 24 of 26 distinct five-word shingles are shared
+MOAT_REVISED = MOAT.rsplit(" ", 1)[0] + " deliver"
+DEBT = ("We repaid the remaining term loan during the year and now carry no long-term debt "
+        "leaving the balance sheet able to absorb a severe downturn without new financing")
+SUPPLY = ("A single supplier in one region provides most of the specialty resin used in our "
+          "packaging and a disruption there could halt production for several months")
+
+def paragraphs(*texts):
+    return "\n\n".join(texts)
+
+def test_moved_paragraphs_match_by_hash():
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT, SUPPLY), paragraphs(SUPPLY, MOAT, DEBT))
+
+    assert diff == {"added": [], "modified": [], "removed": [], "unchanged": 3}
+
+def test_formatting_changes_are_unchanged():
+    reformatted = MOAT.upper().replace(" ", "  \n", 3)
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(reformatted, DEBT))
+
+    assert diff["unchanged"] == 2
+
+def test_revised_paragraph_is_paired_with_its_old_wording():
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(DEBT, MOAT_REVISED))
+
+    assert diff == {"added": [], "modified": [(MOAT, MOAT_REVISED)], "removed": [], "unchanged": 1}
+
+def test_dissimilar_paragraph_is_new_not_revised():
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(MOAT, SUPPLY))
+
+    assert diff == {"added": [SUPPLY], "modified": [], "removed": [DEBT], "unchanged": 1}
+
+def test_similarity_threshold(monkeypatch):
+    # Jaccard similarity of 24 / 26, about 0.923
+    monkeypatch.setattr(buffett_app, "CHANGE_SIMILARITY_THRESHOLD", 0.92)
+    assert diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(MOAT_REVISED, DEBT))["modified"]
+
+    monkeypatch.setattr(buffett_app, "CHANGE_SIMILARITY_THRESHOLD", 0.94)
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(MOAT_REVISED, DEBT))
+    assert diff["added"] == [MOAT_REVISED]
+    assert diff["removed"] == [MOAT]
+
+def test_old_paragraph_is_matched_once():
+    # Two revisions of the same paragraph: only one can be paired with it
+    other_revision = MOAT.rsplit(" ", 1)[0] + " sell"
+    diff = diff_paragraphs(paragraphs(MOAT, DEBT), paragraphs(MOAT_REVISED, other_revision, DEBT))
+
+    assert diff["modified"] == [(MOAT, MOAT_REVISED)]
+    assert diff["added"] == [other_revision]
+
+def test_repeated_paragraphs_are_counted_individually():
+    diff = diff_paragraphs(paragraphs(DEBT, MOAT, DEBT), paragraphs(MOAT, DEBT))
+
+    assert diff == {"added": [], "modified": [], "removed": [DEBT], "unchanged": 2}
@@ -0,0 +1,155 @@
+import math
+
+import numpy as np
+import pytest
+
+import buffett_app
+from buffett_app import companyfacts_columns, financial_metrics, retained_earnings_test
+
+def fact(val, end, start=None, fy=None, fp="FY", form="10-K", filed="", accn=""):
+    entry = {"val": val, "end": end, "fy": fy, "fp": fp, "form": form, "filed": filed, "accn": accn}
+    if start:
+        entry["start"] = start
+    return entry
+
+def companyfacts(**concepts):
+    """companyfacts JSON from {"us_gaap__Revenues": [fact, ...]}-style keyword arguments."""
+    facts = {}
+    for key, entries in concepts.items():
+        taxonomy, name = key.split("__")
+        facts.setdefault(taxonomy.replace("_", "-"), {})[name] = {"units": {"USD": entries}}
+    return {"entityName": "Test Co", "facts": facts}
+
+def annual(val, year, **kwargs):
+    return fact(val, f"{year}-12-31", start=f"{year}-01-01", **kwargs)
+
+def values(column):
+    return [None if math.isnan(value) else value for value in column]
+
+def test_restated_value_wins():
+    years, columns = companyfacts_columns(companyfacts(us_gaap__Revenues=[
+        annual(100, 2021, fy=2021, filed="2022-02-01", accn="a21"),
+        annual(200, 2022, fy=2022, filed="2023-02-01", accn="a22"),
+        # The FY2022 10-K restates 2021 as a comparative
+        annual(105, 2021, fy=2022, filed="2023-02-01", accn="a22"),
+        # Quarterly filings never count, however late
+        annual(999, 2022, fy=2023, fp="Q1", form="10-Q", filed="2023-05-01", accn="q1"),
+    ]))
+
+    assert list(years) == [2021, 2022]
+    assert values(columns["revenue"]) == [105, 200]
+
+def test_preferred_concept_wins_over_later_filing():
+    years, columns = companyfacts_columns(companyfacts(
+        us_gaap__Revenues=[annual(100, 2022, fy=2022, filed="2023-02-01", accn="a22")],
+        us_gaap__RevenueFromContractWithCustomerExcludingAssessedTax=[
+            annual(90, 2022, fy=2023, filed="2024-02-01", accn="a23")],
+    ))
+
+    assert values(columns["revenue"]) == [100]
+
+def test_52_53_week_years_keep_the_filers_fiscal_year():
+    # Fiscal years ending on the Saturday nearest December 31
+    periods = [("2019-12-29", "2021-01-02", 2020), ("2021-01-03", "2022-01-01", 2021),
+               ("2022-01-02", "2022-12-31", 2022)]
+    years, columns = companyfacts_columns(companyfacts(us_gaap__NetIncomeLoss=[
+        fact(value, end, start=start, fy=fy, filed=f"{fy + 1}-02-15", accn=f"a{fy}")
+        for value, (start, end, fy) in zip((100, 111, 120), periods)
+    ]))
+
+    assert list(years) == [2020, 2021, 2022]
+    assert values(columns["net_income"]) == [100, 111, 120]
+
+def test_unreported_years_are_nan():
+    years, columns = companyfacts_columns(companyfacts(
+        us_gaap__Revenues=[annual(100, 2019, fy=2019, accn="a19"), annual(130, 2021, fy=2021, accn="a21")],
+        us_gaap__NetIncomeLoss=[annual(10, 2021, fy=2021, accn="a21")],
+    ))
+
+    assert list(years) == [2019, 2020, 2021]
+    assert values(columns["revenue"]) == [100, None, 130]
+    assert values(columns["net_income"]) == [None, None, 10]
+
+def test_balance_sheet_values_count_at_fiscal_year_ends_only():
+    years, columns = companyfacts_columns(companyfacts(
+        us_gaap__NetIncomeLoss=[annual(10, 2022, fy=2022, accn="a22")],
+        us_gaap__StockholdersEquity=[fact(50, "2022-12-31", fy=2022, accn="a22"),
+                                     fact(45, "2022-06-30", fy=2022, accn="a22")],
+    ))
+
+    assert values(columns["equity"]) == [50]
+
+def test_public_float_belongs_to_its_10k():
+    # Fiscal year ends in June; the float is measured at the prior December 31
+    years, columns = companyfacts_columns(companyfacts(
+        us_gaap__NetIncomeLoss=[fact(10, "2023-06-30", start="2022-07-01", fy=2023, accn="a23")],
+        dei__EntityPublicFloat=[fact(5e9, "2022-12-31", fy=2023, accn="a23")],
+    ))
+
+    assert list(years) == [2023]
+    assert values(columns["public_float"]) == [5e9]
+
+def test_public_float_without_its_10k_is_dropped():
+    years, columns = companyfacts_columns(companyfacts(
+        us_gaap__NetIncomeLoss=[annual(10, 2022, fy=2022, accn="a22")],
+        dei__EntityPublicFloat=[fact(5e9, "2022-06-30", fy=2022, accn="unknown")],
+    ))
+
+    assert values(columns["public_float"]) == [None]
+
+def test_retained_earnings_test_uses_first_and_last_comparable_years():
+    retained = np.array([[np.nan, 100.0, 150.0, 220.0, np.nan],
+                         [10.0, np.nan, np.nan, np.nan, np.nan]])
+    market = np.array([[1000.0, 1100.0, np.nan, 1300.0, 1500.0],
+                       [500.0, 600.0, 700.0, 800.0, 900.0]])
+    first, last, retained_added, market_added = retained_earnings_test(retained, market)
+
+    assert (first[0], last[0], retained_added[0], market_added[0]) == (1, 3, 120.0, 200.0)
+    # Only one comparable year
+    assert np.isnan(retained_added[1]) and np.isnan(market_added[1])
+
+def test_retained_earnings_test_without_years():
+    first, last, retained_added, market_added = retained_earnings_test(np.empty((2, 0)), np.empty((2, 0)))
+
+    assert np.isnan(retained_added).all() and np.isnan(market_added).all()
+
+def columns(years, **fields):
+    years = np.array(years)
+    return "Test Co", years, {field: np.array(fields.get(field, [np.nan] * len(years)), dtype=float)
+                              for field in buffett_app.FINANCIAL_CONCEPTS}
+
+@pytest.fixture
+def loaded(monkeypatch):
+    companies = {}
+    monkeypatch.setattr(buffett_app, "load_financial_columns", companies.get)
+    return companies
+
+def test_financial_metrics(loaded):
+    loaded["1"] = columns([2020, 2021, 2022],
+                          revenue=[1000, np.nan, 1200], net_income=[100, 110, 120],
+                          equity=[400, 600, -700], long_term_debt=[200, 300, 100],
+                          retained_earnings=[300, 350, 420], public_float=[2000, 2100, 2050])
+    loaded["2"] = columns([2022, 2023], net_income=[5, 6])
+    first, second, missing = financial_metrics(["1", "2", "3"])
+
+    assert missing is None
+    assert first["years"] == [2020, 2021, 2022]
+    metrics = first["metrics"]
+    assert metrics["revenue"] == [1000, None, 1200]
+    # The first year has no prior equity to average with; average equity is negative in the last
+    assert metrics["return_on_equity"] == [0.25, 0.22, None]
+    assert metrics["net_margin"] == [0.1, None, 0.1]
+    assert metrics["debt_to_equity"] == [0.5, 0.5, None]
+    assert first["retained_earnings_test"] == {
+        "from_year": 2020, "to_year": 2022, "retained_earnings_added": 120.0, "market_value_added": 50.0,
+        "market_value_per_retained_dollar": 0.4167, "passes": False,
+    }
+    # Companies share one year axis, but each reports only its own years
+    assert second["years"] == [2022, 2023]
+    assert second["retained_earnings_test"] is None
+
+def test_financial_metrics_window(loaded):
+    loaded["1"] = columns([2019, 2020, 2021, 2022], net_income=[1, 2, 3, 4])
+
+    assert financial_metrics(["1"], years=2)[0]["years"] == [2021, 2022]
+    assert financial_metrics(["1"], years=2, through=2020)[0]["years"] == [2019, 2020]
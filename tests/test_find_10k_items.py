@@ -0,0 +1,72 @@
+from buffett_app import extract_sections, find_10k_items
+
+def filing(*items):
+    """A 10-K body from (heading, text) pairs, preceded by a table of contents listing them."""
+    toc = "TABLE OF CONTENTS\n" + "".join(f"{heading} {page}\n" for page, (heading, _) in enumerate(items, 3))
+    return toc + "".join(f"\n{heading}\n{text}\n" for heading, text in items)
+
+def names(items):
+    return [(item["item"], item["name"]) for item in items]
+
+def test_skips_table_of_contents():
+    text = filing(("Item 1. Business", "We make widgets."),
+                  ("Item 1A. Risk Factors", "Widgets may fall out of fashion."),
+                  ("Item 7. Management's Discussion and Analysis", "Sales rose."),
+                  ("Item 8. Financial Statements and Supplementary Data", "See the tables."))
+    body = text.index("\nItem 1. Business\n")
+    items = find_10k_items(text)
+
+    assert len(items) == 4
+    assert all(item["start"] > body for item in items)
+    sections = extract_sections(text)
+    assert sections["Business"] == "Item 1. Business\nWe make widgets."
+    assert sections["Risk Factors"] == "Item 1A. Risk Factors\nWidgets may fall out of fashion."
+
+def test_lettered_items():
+    text = filing(("Item 1. Business", "Body."),
+                  ("Item 1A. Risk Factors", "Body."),
+                  ("Item 1B. Unresolved Staff Comments", "None."),
+                  ("Item 1C. Cybersecurity", "Body."),
+                  ("Item 7A. Quantitative and Qualitative Disclosures About Market Risk", "Body."),
+                  ("Item 9A. Controls and Procedures", "Body."),
+                  ("Item 9B. Other Information", "None."),
+                  ("Item 9C. Disclosure Regarding Foreign Jurisdictions that Prevent Inspections", "None."),
+                  ("Item 10. Directors, Executive Officers and Corporate Governance", "Body."))
+
+    assert [item["item"] for item in find_10k_items(text)] == ["1", "1A", "1B", "1C", "7A", "9A", "9B", "9C", "10"]
+
+def test_each_section_ends_at_the_next_item():
+    text = filing(("Item 9A. Controls and Procedures", "Effective."),
+                  ("Item 9B. Other Information", "None."),
+                  ("Item 9C. Disclosure Regarding Foreign Jurisdictions that Prevent Inspections", "Not applicable."))
+    sections = extract_sections(text)
+
+    assert sections["Controls and Procedures"] == "Item 9A. Controls and Procedures\nEffective."
+    assert sections["Other Information"] == "Item 9B. Other Information\nNone."
+
+def test_title_letter_is_not_an_item_letter():
+    # "Item 1Business": the B starts the title, it does not make this Item 1B
+    text = filing(("Item 1Business", "We make widgets."), ("ITEM 1A - RISK FACTORS", "Risks."))
+
+    assert names(find_10k_items(text)) == [("1", "Business"), ("1A", "Risk Factors")]
+
+def test_item_6_former_title():
+    older = filing(("Item 5. Market for Registrant's Common Equity", "Listed."),
+                   ("Item 6. Selected Financial Data", "Five years of figures."),
+                   ("Item 7. Management's Discussion and Analysis", "Sales rose."))
+    newer = filing(("Item 5. Market for Registrant's Common Equity", "Listed."),
+                   ("Item 6. [Reserved]", ""),
+                   ("Item 7. Management's Discussion and Analysis", "Sales rose."))
+
+    assert ("6", "Selected Financial Data") in names(find_10k_items(older))
+    assert extract_sections(older)["Selected Financial Data"] == "Item 6. Selected Financial Data\nFive years of figures."
+    assert ("6", "Reserved") in names(find_10k_items(newer))
+
+def test_untitled_mention_is_only_a_boundary():
+    text = filing(("Item 1. Business", "We make widgets."),
+                  ("Item 2", "as required."),
+                  ("Item 7. Management's Discussion and Analysis", "Sales rose."))
+    sections = extract_sections(text)
+
+    assert "Properties" not in sections
+    assert sections["Business"] == "Item 1. Business\nWe make widgets."
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+import buffett_app
+from buffett_app import get_job, insert_job, job_event_fields, job_payload, track_job, untrack_job
+
+def set_job(job_id, **fields):
+    conn = buffett_app.db_connect()
+    try:
+        with conn:
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+def stale_time():
+    return time.time() - buffett_app.JOB_STALE_SECONDS - 1
+
+def test_identical_live_job_is_reused(cache_dir):
+    job_id, created = insert_job("AAPL", "business")
+
+    assert created
+    assert insert_job("AAPL", "business") == (job_id, False)
+    assert insert_job("AAPL", "business", 2020)[1]
+    assert insert_job("AAPL", "risk factors")[1]
+
+def test_stale_job_is_not_reused(cache_dir):
+    job_id, _ = insert_job("AAPL", "business")
+    set_job(job_id, status="running", updated_at=stale_time())
+
+    new_id, created = insert_job("AAPL", "business")
+    assert created
+    assert new_id != job_id
+
+def test_stale_job_is_reported_failed(cache_dir):
+    job_id, _ = insert_job("AAPL", "business")
+    set_job(job_id, status="running", stage="analyze_with_gemini")
+    assert job_payload(get_job(job_id))["status"] == "running"
+
+    set_job(job_id, updated_at=stale_time())
+    payload = job_payload(get_job(job_id))
+    assert payload["status"] == "failed"
+    assert payload["error_status"] == 500
+
+def test_finished_job_is_never_stale(cache_dir):
+    job_id, _ = insert_job("AAPL", "business")
+    set_job(job_id, status="done", summary="Wonderful business.", result='{"summary": "Wonderful business."}')
+    set_job(job_id, updated_at=stale_time())
+
+    payload = job_payload(get_job(job_id))
+    assert payload["status"] == "done"
+    assert payload["result"] == {"summary": "Wonderful business."}
+
+def test_heartbeat_keeps_tracked_jobs_fresh(cache_dir, monkeypatch):
+    monkeypatch.setattr(buffett_app, "_JOB_HEARTBEAT_SECONDS", 0.01)
+    monkeypatch.setattr(buffett_app, "_job_heartbeat", None)
+    tracked, _ = insert_job("AAPL", "business")
+    untracked, _ = insert_job("MSFT", "business")
+    finished, _ = insert_job("KO", "business")
+    set_job(finished, status="done")
+    for job_id in (tracked, untracked, finished):
+        set_job(job_id, updated_at=stale_time())
+
+    track_job(tracked)
+    track_job(finished)
+    try:
+        deadline = time.monotonic() + 5
+        while job_payload(get_job(tracked))["status"] != "queued":
+            assert time.monotonic() < deadline, "heartbeat did not refresh the job"
+            time.sleep(0.01)
+    finally:
+        untrack_job(tracked)
+        untrack_job(finished)
+
+    assert job_payload(get_job(untracked))["status"] == "failed"
+    assert get_job(finished)["updated_at"] < time.time() - buffett_app.JOB_STALE_SECONDS
+
+@pytest.mark.parametrize("event, data, fields", [
+    ("progress", {"stage": "get_cik", "message": "Looking up ticker"},
+     {"stage": "get_cik", "message": "Looking up ticker"}),
+    ("failed", {"error": "Ticker not found", "status": 404},
+     {"status": "failed", "error": "Ticker not found", "http_status": 404}),
+    ("heartbeat", {}, None),
+])
+def test_job_event_fields(event, data, fields):
+    assert job_event_fields({"chunks": [], "published": 0}, event, data) == fields
+
+def test_partial_summaries_are_throttled():
+    job = {"chunks": [], "published": 0}
+
+    assert job_event_fields(job, "summary", {"text": "Moat "}) == {"summary": "Moat "}
+    assert job_event_fields(job, "summary", {"text": "is "}) is None
+    # As if the interval had passed since the last publish
+    job["published"] -= buffett_app._JOB_PROGRESS_INTERVAL
+    assert job_event_fields(job, "summary", {"text": "wide."}) == {"summary": "Moat is wide."}
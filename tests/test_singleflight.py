@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+import buffett_app
+from buffett_app import singleflight
+
+FOLLOWERS = 3
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def run_flight(key, fn, caplog):
+    """Run fn in a leader with FOLLOWERS callers waiting on it. Returns every caller's outcome."""
+    caplog.set_level(logging.INFO, logger=buffett_app.logger.name)
+    started = threading.Event()
+    release = threading.Event()
+    outcomes = []
+
+    def leader_fn():
+        started.set()
+        release.wait(5)
+        return fn()
+
+    def call(fn):
+        try:
+            outcomes.append(("result", singleflight(key, fn)))
+        except Exception as e:
+            outcomes.append(("error", e))
+
+    threads = [threading.Thread(target=call, args=(leader_fn,))]
+    threads[0].start()
+    started.wait(5)
+    # Followers would become leaders themselves if they called fn, so fn must not be reached
+    threads += [threading.Thread(target=call, args=(lambda: pytest.fail("follower ran fn"),))
+                for _ in range(FOLLOWERS)]
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: sum("Waiting on in-flight" in r.getMessage() for r in caplog.records) == FOLLOWERS)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+def test_followers_share_the_leader_result(cache_dir, caplog):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {"summary": "shared"}
+
+    outcomes = run_flight(("summary", "t1"), fn, caplog)
+
+    assert len(calls) == 1
+    assert len(outcomes) == FOLLOWERS + 1
+    assert all(kind == "result" and value is outcomes[0][1] for kind, value in outcomes)
+
+def test_leader_error_reaches_followers(cache_dir, caplog):
+    error = RuntimeError("Gemini unavailable")
+
+    def fn():
+        raise error
+
+    outcomes = run_flight(("summary", "t2"), fn, caplog)
+
+    assert outcomes == [("error", error)] * (FOLLOWERS + 1)
+
+def test_keys_are_released(cache_dir):
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        singleflight(("summary", "t3"), fail)
+    assert ("summary", "t3") not in buffett_app._flights
+    # The next call leads a new flight rather than reusing the failure
+    assert singleflight(("summary", "t3"), lambda: "ok") == "ok"
+    assert ("summary", "t3") not in buffett_app._flights
+
+def test_lock_files_are_removed(cache_dir):
+    for i in range(5):
+        singleflight(("summary", i), lambda: i)
+
+    assert os.listdir(buffett_app.SINGLEFLIGHT_LOCK_DIR) == []
+
+def test_distinct_keys_do_not_wait(cache_dir):
+    release = threading.Event()
+    thread = threading.Thread(target=singleflight, args=(("summary", "slow"), lambda: release.wait(5)))
+    thread.start()
+    try:
+        wait_for(lambda: ("summary", "slow") in buffett_app._flights)
+        assert singleflight(("summary", "fast"), lambda: "fast") == "fast"
+    finally:
+        release.set()
+        thread.join(5)